@@ -1,6 +1,6 @@
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, send_from_directory, send_file, abort, Response
 import os
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, safe_join
 import fitz  # PyMuPDF for PDF processing
 import time  # For simulating processing time
 import json
@@ -10,8 +10,8 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import API_URL, API_KEY, MODEL_NAME, QWEN_PROMPT  # Changed from relative to absolute import
 import base64
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+import hashlib
+import binascii
 import threading
 from threading import Semaphore
 try:
@@ -28,8 +28,12 @@ from datetime import datetime
 import re
 from pdf_processor import process_pdf_with_qwen
 from image_analyzer import analyze_image_with_qwen
-from extract_handler import ExtractHandler  # Import the ExtractHandler class
-from upload_handler import UploadHandler  # Import the UploadHandler class
+from page_manifest import manifest_path
+from results_db import iter_pages, category_counts, page_counts, catalog_children, CATALOG_LEVELS, delete_pdf, get_generation
+from response_cache import ResponseCache
+from artifact_cache import COMPRESSED_DIR, file_etag, compress, compressed_body, negotiate_encoding
+from page_normalizer import NORMALIZED_DIR
+from thumbnails import THUMBNAIL_SIZES, SPRITE_SIZE, get_thumbnail, build_sprite, sprite_paths
 
 # Initialize Flask app with static folder configuration
 app = Flask(__name__, 
@@ -72,8 +76,10 @@ def upload_files():
     base_dirs = [
         os.path.join(os.path.dirname(__file__), 'extracts', client, report_type, year),
         os.path.join(os.path.dirname(__file__), 'jsons', client, report_type, year), 
-        os.path.join(os.path.dirname(__file__), 'processed', client, report_type, year)
-    ]
+        os.path.join(os.path.dirname(__file__), 'processed', client, report_type, year),
+        # Derived copies, which would otherwise outlive the analyses they were made from
+        os.path.join(NORMALIZED_DIR, client, report_type, year),
+    ] + [os.path.join(COMPRESSED_DIR, tree, client, report_type, year) for tree in ('jsons', 'processed')]
     
     # Get list of filenames (without extension) from uploaded files
     uploaded_filenames = [os.path.splitext(secure_filename(f.filename))[0] 
@@ -95,6 +101,14 @@ def upload_files():
                 print(f"Error clearing directories in {dir_path}: {str(e)}")
                 # Continue with upload even if cleanup fails
 
+    # Drop page manifests and database rows of re-uploaded PDFs so they only list the new analyses
+    for pdf_name in uploaded_filenames:
+        delete_pdf(client, report_type, year, pdf_name)
+        stale_manifest = manifest_path(client, report_type, year, pdf_name)
+        if os.path.exists(stale_manifest):
+            os.remove(stale_manifest)
+            print(f"Cleared existing manifest: {stale_manifest}")
+
     if not files or (files[0] and files[0].filename == ''):
         return jsonify({"message": "No selected files"}), 400
 
@@ -161,67 +175,176 @@ def upload_files():
         "errors": errors
     })
 
+# Versioned artifact URLs (?v=<etag>) never change, so browsers may keep them for a year
+ARTIFACT_MAX_AGE = 365 * 24 * 3600
+
+def send_artifact(directory: str, filename: str) -> Response:
+    """Serve a per-page artifact with a strong ETag, compressed JSON and range support for everything else.
+
+    Plain URLs must be revalidated (a re-uploaded PDF rewrites its artifacts), which costs a 304;
+    requests carrying ?v=<etag> address one exact version of the file and are marked immutable.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    etag = file_etag(path)
+    is_json = path.endswith('.json')
+    encoding = negotiate_encoding(request.accept_encodings) if is_json else None
+    # Each representation needs its own strong validator
+    representation_etag = f"{etag}-{encoding}" if encoding else etag
+    if request.if_none_match.contains(representation_etag):
+        response = Response(status=304)
+        response.set_etag(representation_etag)
+    elif encoding:
+        response = Response(compressed_body(path, encoding), mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(representation_etag)
+    else:
+        response = send_file(path, conditional=True, etag=etag)
+    if is_json:
+        response.vary.add('Accept-Encoding')
+    if request.args.get('v') == etag:
+        response.headers['Cache-Control'] = f'public, max-age={ARTIFACT_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # Add this new route to serve extracted images
 @app.route('/extracts/<path:filename>')
 def serve_extract(filename):
     extracts_dir = os.path.join(os.path.dirname(__file__), 'extracts')
-    return send_from_directory(extracts_dir, filename)
+    return send_artifact(extracts_dir, filename)
+
+@app.route('/thumbnails/<int:size>/<path:filename>')
+def serve_thumbnail(size, filename):
+    """WebP preview of an extracted page image, e.g. /thumbnails/160/<client>/<type>/<year>/<pdf>/<pdf>_page_1.jpg"""
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"error": f"Unsupported thumbnail size {size}; use one of {', '.join(map(str, THUMBNAIL_SIZES))}"}), 400
+    extracts_dir = os.path.join(os.path.dirname(__file__), 'extracts')
+    image_path = safe_join(extracts_dir, filename)
+    if image_path is None or not os.path.isfile(image_path):
+        abort(404)
+    thumb_path = get_thumbnail(image_path, size)
+    return send_artifact(extracts_dir, os.path.relpath(thumb_path, extracts_dir).replace(os.sep, '/'))
+
+@app.route('/sprites/<path:filename>')
+def serve_sprite(filename):
+    """Sprite sheet of a PDF's page thumbnails: /sprites/<client>/<type>/<year>/<pdf>.webp, with a .json index"""
+    pdf_dir, ext = os.path.splitext(filename)
+    if ext not in ('.webp', '.json'):
+        abort(404)
+    extracts_dir = os.path.join(os.path.dirname(__file__), 'extracts')
+    pdf_path = safe_join(extracts_dir, pdf_dir)
+    if pdf_path is None or not os.path.isdir(pdf_path):
+        abort(404)
+    build_sprite(pdf_path, SPRITE_SIZE)
+    sprite_path, index_path = sprite_paths(pdf_path, SPRITE_SIZE)
+    path = sprite_path if ext == '.webp' else index_path
+    if not os.path.exists(path):
+        abort(404)
+    return send_artifact(extracts_dir, os.path.relpath(path, extracts_dir).replace(os.sep, '/'))
 
 @app.route('/jsons/<path:filename>')
 def serve_json(filename):
     jsons_dir = os.path.join(os.path.dirname(__file__), 'jsons')
-    return send_from_directory(jsons_dir, filename)
+    return send_artifact(jsons_dir, filename)
 
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
     uploads_dir = os.path.join(os.path.dirname(__file__), 'uploads')
     return send_from_directory(uploads_dir, filename)
 
-# Add rate limiting semaphore (adjust max_workers as needed)
-MAX_CONCURRENT_REQUESTS = 3  # Safe number of concurrent API calls
-request_semaphore = Semaphore(MAX_CONCURRENT_REQUESTS)
-
-# Setup extracts directory and ensure it exists
-extracts_dir = os.path.join(os.path.dirname(__file__), 'extracts')
-os.makedirs(extracts_dir, exist_ok=True)
-print(f"Watching extracts directory: {extracts_dir}")
-
-# Initialize extract_handler regardless of environment
-extract_handler = ExtractHandler(request_semaphore)
-
-# Setup extracts observer with proper configuration
-# Modified condition to run in both development and production modes
-if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or os.environ.get('PRODUCTION_MODE', 'false').lower() == 'true':
-    extracts_observer = Observer()
-    extracts_observer.schedule(
-        extract_handler,
-        path=extracts_dir,
-        recursive=True
-    )
-    print(f"Starting extracts observer with recursive=True")
-    extracts_observer.start()
-
-# Initialize upload handler with recently_processed dictionary
-upload_handler = UploadHandler(UPLOAD_FOLDER)
-upload_handler.recently_processed = {}
-
-# Setup upload observer
-if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or os.environ.get('PRODUCTION_MODE', 'false').lower() == 'true':
-    upload_observer = Observer()
-    upload_observer.schedule(upload_handler, path=UPLOAD_FOLDER, recursive=True)
-    upload_observer.start()
-
-# Add cache dictionary
-RESULTS_CACHE = {}
-CACHE_EXPIRY_SECONDS = 300  # 5 minutes cache duration
-
-def cache_key(client: str, report_type: str, years: List[str], categories: List[str]) -> str:
+# Serialized /query-results responses, bounded by size and validated by the results database generation
+RESULTS_CACHE = ResponseCache(int(os.environ.get('RESULTS_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+# /summary and /metadata bodies, kept apart so large query results never evict the dashboard's first paint
+VIEW_CACHE = ResponseCache(16 * 1024 * 1024)
+
+# Fields a /query-results item can carry; category_names and key_figures are derived from content_json
+RESULT_FIELDS = ('path', 'client', 'report_type', 'year', 'filename', 'page', 'data', 'content_json')
+DERIVED_FIELDS = ('category_names', 'key_figures')
+MAX_RESULTS_PAGE_SIZE = 1000
+
+def cache_key(client: str, report_type: str, years: List[str], categories: List[str],
+              fields: List[str] = None, cursor: str = None, limit: int = None, fmt: str = 'json') -> str:
     """Generate a unique cache key for the query parameters"""
-    return f"{client}_{report_type}_{'_'.join(sorted(years))}_{'_'.join(sorted(categories))}"
+    return json.dumps([client, report_type, sorted(years), sorted(c.strip().lower() for c in categories),
+                       fields, cursor, limit, fmt])
+
+def materialized_view(name: str, build) -> Optional[Response]:
+    """Serve a dashboard aggregate from memory, rebuilding it from the aggregate tables only after a write.
+
+    Returns None when build() has nothing to report.
+    """
+    generation = get_generation()
+    etag = ResponseCache.make_etag(name, generation)
+    unchanged = not_modified(etag)
+    if unchanged is not None:
+        return unchanged
+    cached = VIEW_CACHE.get(name, generation)
+    if cached:
+        return cached_json_response(cached[1], cached[0])
+    view = build()
+    if view is None:
+        return None
+    body = json.dumps(view).encode('utf-8')
+    etag = VIEW_CACHE.put(name, generation, body)
+    return cached_json_response(body, etag)
+
+def encode_cursor(result: Dict) -> str:
+    """Opaque cursor pointing just past this result"""
+    position = json.dumps([result['year'], result['filename'], result['page']])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        year, pdf_name, page = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(year), str(pdf_name), int(page)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def project_result(result: Dict, fields: Optional[List[str]]) -> Dict:
+    """Keep only the requested fields of a query result"""
+    if not fields:
+        return result
+    # Older or partial records may lack any level of this, so read it leniently
+    categories = [c for c in (result.get('content_json') or {}).get('categories') or [] if isinstance(c, dict)]
+    projected = {}
+    for field in fields:
+        if field == 'category_names':
+            projected[field] = [c.get('name') for c in categories]
+        elif field == 'key_figures':
+            projected[field] = [dict(figure, category=c.get('name'))
+                                for c in categories
+                                for figure in (c.get('content') or {}).get('key_figures') or []
+                                if isinstance(figure, dict)]
+        else:
+            projected[field] = result.get(field)
+    return projected
+
+def not_modified(etag: str) -> Optional[Response]:
+    """304 response if the client already holds this ETag"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    return None
+
+def cached_json_response(body: bytes, etag: str) -> Response:
+    """JSON response that clients must revalidate, which costs a 304 when nothing changed"""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/query-results', methods=['GET', 'POST'])
 def query_results():
-    """Query processed results by client, report type, years and categories"""
+    """Query processed results by client, report type, years and categories.
+
+    Optional parameters: limit and cursor for keyset pagination (the response carries next_cursor),
+    fields to project each result (e.g. page,category_names,key_figures), and format=ndjson to stream
+    one result per line followed by a final {"end": true, "count": ..., "next_cursor": ...} line.
+    """
     try:
         # Handle both GET and POST requests
         if request.method == 'POST':
@@ -230,11 +353,19 @@ def query_results():
             report_type = data.get('report_type')
             years = data.get('years', [])  # Expecting array of years
             categories = data.get('categories', [])  # Expecting array of categories
+            fields = data.get('fields', [])
+            limit = data.get('limit')
+            cursor = data.get('cursor')
+            fmt = data.get('format', 'json')
         else:  # GET
             client = request.args.get('client')
             report_type = request.args.get('report_type')
             years = request.args.getlist('year')  # Multiple years can be specified
             categories = request.args.getlist('category')  # Multiple categories can be specified
+            fields = request.args.getlist('fields')
+            limit = request.args.get('limit')
+            cursor = request.args.get('cursor')
+            fmt = request.args.get('format', 'json')
         
         # Validate required parameters
         if not all([client, report_type]):
@@ -247,288 +378,141 @@ def query_results():
         if invalid_years:
             return jsonify({"error": f"Invalid year format: {', '.join(invalid_years)}"}), 400
         
-        # Check cache first
-        key = cache_key(client, report_type, years, categories)
-        cached = RESULTS_CACHE.get(key)
+        # Accept fields=a,b as well as repeated fields=a&fields=b
+        if isinstance(fields, str):
+            fields = [fields]
+        fields = [f.strip() for field in fields for f in field.split(',') if f.strip()]
+        unknown_fields = [f for f in fields if f not in RESULT_FIELDS + DERIVED_FIELDS]
+        if unknown_fields:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown_fields)}"}), 400
+        if fmt not in ('json', 'ndjson'):
+            return jsonify({"error": f"Invalid format: {fmt}"}), 400
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                return jsonify({"error": f"Invalid limit: {limit}"}), 400
+            if not 1 <= limit <= MAX_RESULTS_PAGE_SIZE:
+                return jsonify({"error": f"limit must be between 1 and {MAX_RESULTS_PAGE_SIZE}"}), 400
+        try:
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        if cached and (datetime.now() - cached['timestamp']).total_seconds() < CACHE_EXPIRY_SECONDS:
-            print(f"Returning cached results for key: {key}")
-            # return jsonify(cached['data'])
+        # One generation read validates both the client's copy and ours
+        key = cache_key(client, report_type, years, categories, fields, cursor, limit, fmt)
+        generation = get_generation()
+        etag = ResponseCache.make_etag(key, generation)
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
         
-        # Build base directory path
-        base_dir = os.path.join(os.path.dirname(__file__), 'jsons')
-        results = []
+        # Indexed lookup instead of walking and parsing every page JSON; one extra row tells us if there is a next page
+        include_raw = not fields or 'data' in fields
+        rows = iter_pages(client, report_type, years, categories, after=after,
+                          limit=limit + 1 if limit else None, include_raw=include_raw)
         
-        # Process each requested year
-        for year in years:
-            year_dir = os.path.join(base_dir, client, report_type, year)
+        if fmt == 'ndjson':
+            # Streamed straight from the database cursor, so it is never held in memory or cached
+            def generate():
+                count = 0
+                last = None
+                for result in rows:
+                    if limit and count == limit:
+                        yield json.dumps({'end': True, 'count': count, 'next_cursor': encode_cursor(last)}) + '\n'
+                        return
+                    count += 1
+                    last = result
+                    yield json.dumps(project_result(result, fields)) + '\n'
+                yield json.dumps({'end': True, 'count': count, 'next_cursor': None}) + '\n'
             
-            if not os.path.exists(year_dir):
-                continue  # Skip if directory doesn't exist
-                
-            # Walk through all JSON files in the directory
-            for root, _, files in os.walk(year_dir):
-                for file in files:
-                    if file.endswith('.json'):
-                        json_path = os.path.join(root, file)
-                        
-                        try:
-                            # Extract filename and page number from path
-                            filename = os.path.basename(root)  # PDF filename without extension
-                            page_match = re.search(r'_page_(\d+)', file)
-                            page_num = int(page_match.group(1)) if page_match else 1
-                            
-                            # Check file modification time
-                            file_mtime = os.path.getmtime(json_path)
-                            
-                            # If we have a cached version and file hasn't changed, use cached data
-                            if cached and json_path in cached['file_times']:
-                                if cached['file_times'][json_path] >= file_mtime:
-                                    results.append(cached['file_data'][json_path])
-                                    continue
-                            
-                            # Otherwise read from disk
-                            with open(json_path, 'r', encoding='utf-8') as f:
-                                data = json.load(f)
-                                
-                                # Initialize common variables
-                                content_json = None
-                                doc_category_names = []
-                                
-                                # Parse content_json if available
-                                if 'choices' in data:
-                                    try:
-                                        content = data['choices'][0]['message']['content']
-                                        if content.startswith('```json') and content.endswith('```'):
-                                            content = content[7:-3].strip()
-                                        content_json = json.loads(content) if isinstance(content, str) else content
-                                    except Exception as e:
-                                        print(f"Error parsing content_json: {str(e)}")
-                                
-                                # Extract categories from both direct format and choices format
-                                if 'categories' in data:
-                                    doc_category_names.extend([c['name'].lower() for c in data.get('categories', [])])
-                                elif content_json and 'categories' in content_json:
-                                    doc_category_names.extend([c['name'].lower() for c in content_json.get('categories', [])])
-                                
-                                # Create result item if no categories specified or if matches any category
-                                if not categories or any(cat.lower() in doc_category_names for cat in categories):
-                                    result_item = {
-                                        'path': json_path,
-                                        'client': client,
-                                        'report_type': report_type,
-                                        'year': year,
-                                        'filename': filename,
-                                        'page': page_num,
-                                        'data': data,
-                                        'content_json': content_json
-                                    }
-                                    results.append(result_item)
-                                else:
-                                    # Handle both direct format and choices format
-                                    doc_category_names = []
-                                    
-                                    # Check if data is in direct format (your example)
-                                    if 'categories' in data:
-                                        doc_category_names.extend([c['name'].lower() for c in data.get('categories', [])])
-                                    # Check if data contains choices array
-                                    elif 'choices' in data:
-                                        for choice in data.get('choices', []):
-                                            content = choice.get('message', {}).get('content', '{}')
-
-                                            if content.startswith('```json') and content.endswith('```'):
-                                                content = content[7:-3].strip()  # Remove ```json and ```
-                   
-                                            try:
-                                                if isinstance(content, str):
-                                                    try:
-                                                        content_json = json.loads(content)
-                                                    except json.JSONDecodeError:
-                                                        if isinstance(content, dict):
-                                                            content_json = content
-                                                        else:
-                                                            raise
-                                                    
-                                                    # Check if content_json has categories
-                                                    if 'categories' in content_json:
-                                                        try:
-                                                            categories_list = content_json.get('categories', [])
-                                                            if not isinstance(categories_list, list):
-                                                                print(f"Warning: Expected list but got {type(categories_list)} for categories in {json_path}")
-                                                                continue
-                                                            
-                                                            # Extract and validate category names
-                                                            valid_categories = []
-                                                            for category in categories_list:
-                                                                if not isinstance(category, dict):
-                                                                    print(f"Warning: Invalid category format in {json_path}")
-                                                                    continue
-                                                                
-                                                                category_name = category.get('name')
-                                                                if not category_name or not isinstance(category_name, str):
-                                                                    print(f"Warning: Missing or invalid category name in {json_path}")
-                                                                    continue
-                                                                
-                                                                normalized_name = category_name.strip().lower()
-                                                                if normalized_name:
-                                                                    valid_categories.append(normalized_name)
-                                                            
-                                                            if valid_categories:
-                                                                doc_category_names.extend(valid_categories)
-                                                                print(f"Added {len(valid_categories)} valid categories from {json_path}")
-                                                            else:
-                                                                print(f"No valid categories found in {json_path}")
-                                                        
-                                                        except Exception as e:
-                                                            print(f"Error processing categories in {json_path}: {str(e)}")
-                                            except json.JSONDecodeError as e:
-                                                print(f"Failed to decode JSON content: {str(e)}")
-                                                print(f"Problematic content: {content}")
-                                                continue
-                                    
-                                    if any(cat.lower() in doc_category_names for cat in categories):
-                                        result_item = {
-                                            'path': json_path,
-                                            'client': client,
-                                            'report_type': report_type,
-                                            'year': year,
-                                            'data': data,
-                                            'content_json': content_json  # Add the parsed content_json
-                                        }
-                                        results.append(result_item)
-                                
-                        except Exception as e:
-                            print(f"Error reading {json_path}: {str(e)}")
-                            continue
+            response = Response(generate(), mimetype='application/x-ndjson')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        
+        cached = RESULTS_CACHE.get(key, generation)
+        if cached:
+            print(f"Returning cached results for key: {key}")
+            return cached_json_response(cached[1], cached[0])
+        
+        results = list(rows)
+        next_cursor = None
+        if limit and len(results) > limit:
+            results = results[:limit]
+            next_cursor = encode_cursor(results[-1])
         
         response_data = {
             'count': len(results),
-            'results': results
+            'results': [project_result(result, fields) for result in results],
+            'next_cursor': next_cursor
         }
         
         # Update cache
-        file_times = {}
-        file_data = {}
-        for result in results:
-            json_path = result['path']
-            file_times[json_path] = os.path.getmtime(json_path)
-            file_data[json_path] = result
-            
-        RESULTS_CACHE[key] = {
-            'timestamp': datetime.now(),
-            'data': response_data,
-            'file_times': file_times,
-            'file_data': file_data
-        }
-        
-        return jsonify(response_data)
+        body = json.dumps(response_data).encode('utf-8')
+        etag = RESULTS_CACHE.put(key, generation, body)
+        return cached_json_response(body, etag)
         
     except Exception as e:
         return jsonify({"error": f"Query failed: {str(e)}"}), 500
 
-@app.route('/summary', methods=['GET'])
-def get_processed_summary():
-    """Generate summary of all processed files showing total pages and analyzed images"""
-    try:
-        jsons_dir = os.path.join(os.path.dirname(__file__), 'jsons')
-        extracts_dir = os.path.join(os.path.dirname(__file__), 'extracts')
+def build_summary() -> Optional[Dict]:
+    """Summary of all processed files showing total pages and analyzed images"""
+    rows = page_counts()
+    if not rows:
+        return None
         
-        if not os.path.exists(jsons_dir):
-            return jsonify({"error": "No processed files found"}), 404
-            
-        summary = {
-            "total_clients": 0,
-            "clients": []
+    summary = {
+        "total_clients": 0,
+        "clients": []
+    }
+    
+    # Rows arrive sorted by client, report type, year and PDF
+    clients = {}
+    for client, report_type, year, pdf_name, total_pages, analyzed_images in rows:
+        if client not in clients:
+            clients[client] = {
+                "client_name": client,
+                "report_types": {}
+            }
+            summary["clients"].append(clients[client])
+        years = clients[client]["report_types"].setdefault(report_type, {"years": {}})["years"]
+        years.setdefault(year, {})[pdf_name] = {
+            "analyzed_images": analyzed_images,
+            "total_pages": total_pages
         }
-        
-        # Walk through all client directories
-        for client in os.listdir(jsons_dir):
-            client_path = os.path.join(jsons_dir, client)
-            if not os.path.isdir(client_path):
-                continue
-                
-            client_data = {
+    
+    summary["total_clients"] = len(summary["clients"])
+    return summary
+
+def build_metadata() -> Dict:
+    """Structured metadata with category counts"""
+    metadata = {
+        "clients": []
+    }
+
+    # Category counts per PDF from the materialized category_stats table
+    clients = {}
+    for client, report_type, year, pdf_name, category, count in category_counts():
+        if client not in clients:
+            clients[client] = {
                 "client_name": client,
                 "report_types": {}
             }
-            
-            # Process each report type for this client
-            for report_type in os.listdir(client_path):
-                report_path = os.path.join(client_path, report_type)
-                if not os.path.isdir(report_path):
-                    continue
-                    
-                # Initialize report type data
-                client_data["report_types"][report_type] = {
-                    "years": {}
-                }
-                
-                # Process each year for this report type
-                for year in os.listdir(report_path):
-                    year_path = os.path.join(report_path, year)
-                    if not os.path.isdir(year_path) or not year.isdigit():
-                        continue
-                        
-                    print(f"Processing year: {year} for {client}/{report_type}")  # Debug print
-                    
-                    # Initialize counters
-                    file_data = {}
-                    
-                    # Get PDF count from extracts directory
-                    extracts_year_path = os.path.join(extracts_dir, client, report_type, year)
-                    print(f"Checking extracts path: {extracts_year_path}")  # Debug print
-                    
-                    if os.path.exists(extracts_year_path):
-                        print(f"Found extracts directory for {year}")  # Debug print
-                        # Walk through all PDF directories
-                        for pdf_dir in os.listdir(extracts_year_path):
-                            pdf_dir_path = os.path.join(extracts_year_path, pdf_dir)
-                            print(f"Checking PDF directory: {pdf_dir_path}")  # Debug print
-                            
-                            if os.path.isdir(pdf_dir_path):
-                                print(f"Processing PDF directory: {pdf_dir_path}")  # Debug print
-                                # Count images for this PDF
-                                total_pages = sum(1 for root, dirs, files in os.walk(pdf_dir_path) 
-                                         for f in files if f.lower().endswith(('.jpg', '.jpeg', '.png')))
-                                print(f"Found {total_pages} pages in {pdf_dir_path}")  # Debug print
-                                
-                                # Count analyzed images from jsons
-                                json_dir_path = os.path.join(year_path, pdf_dir)
-                                print(f"Checking JSON directory: {json_dir_path}")  # Debug print
-                                
-                                analyzed_images = sum(1 for root, dirs, files in os.walk(json_dir_path) 
-                                          for f in files if f.endswith('.json')) if os.path.exists(json_dir_path) else 0
-                                print(f"Found {analyzed_images} analyzed images in {json_dir_path}")  # Debug print
-                                
-                                # Remove any conditions and always include the data
-                                file_data[pdf_dir] = {
-                                    "analyzed_images": analyzed_images,
-                                    "total_pages": total_pages
-                                }
-                    else:
-                        print(f"Warning: Extracts directory not found for {year}")  # New debug print
-                        # Count analyzed images from jsons
-                        json_dir_path = os.path.join(year_path, pdf_dir)
-                        print(f"Checking JSON directory: {json_dir_path}")  # Debug print
-                        
-                        analyzed_images = sum(1 for root, dirs, files in os.walk(json_dir_path) 
-                                    for f in files if f.endswith('.json')) if os.path.exists(json_dir_path) else 0
-                        print(f"Found {analyzed_images} analyzed images in {json_dir_path}")  # Debug print
-                        
-                        # Remove any conditions and always include the data
-                        file_data[pdf_dir] = {
-                            "analyzed_images": analyzed_images,
-                            "total_pages": total_pages
-                        }
-                    
-                    if file_data:  # Only add if we found data
-                        client_data["report_types"][report_type]["years"][year] = file_data
-            
-            if client_data["report_types"]:  # Only add if we found data
-                summary["clients"].append(client_data)
-        
-        summary["total_clients"] = len(summary["clients"])
-        return jsonify(summary)
+            metadata["clients"].append(clients[client])
+        years = clients[client]["report_types"].setdefault(report_type, {"years": {}})["years"]
+        years.setdefault(year, {}).setdefault(pdf_name, {"category": {}})["category"][category] = count
+    
+    return metadata
+
+@app.route('/summary', methods=['GET'])
+def get_processed_summary():
+    """Generate summary of all processed files showing total pages and analyzed images"""
+    try:
+        response = materialized_view('summary', build_summary)
+        if response is None:
+            return jsonify({"error": "No processed files found"}), 404
+        return response
         
     except Exception as e:
         return jsonify({"error": f"Failed to generate summary: {str(e)}"}), 500
@@ -537,101 +521,55 @@ def get_processed_summary():
 def get_metadata():
     """Return structured metadata with category counts"""
     try:
-        jsons_dir = os.path.join(os.path.dirname(__file__), 'jsons')
-        metadata = {
-            "clients": []
-        }
+        return materialized_view('metadata', build_metadata)
+        
+    except Exception as e:
+        return jsonify({"error": f"Failed to generate metadata: {str(e)}"}), 500
 
-        # Walk through all client directories
-        for client in os.listdir(jsons_dir):
-            client_path = os.path.join(jsons_dir, client)
-            if not os.path.isdir(client_path):
-                continue
-                
-            client_data = {
-                "client_name": client,
-                "report_types": {}
-            }
-            
-            # Process each report type for this client
-            for report_type in os.listdir(client_path):
-                report_path = os.path.join(client_path, report_type)
-                if not os.path.isdir(report_path):
-                    continue
-                    
-                report_data = {
-                    "years": {}
-                }
-                
-                # Process each year for this report type
-                for year in os.listdir(report_path):
-                    year_path = os.path.join(report_path, year)
-                    if not os.path.isdir(year_path) or not year.isdigit():
-                        continue
-                        
-                    year_data = {}
-                    
-                    # Walk through all PDF directories in this year
-                    for pdf_dir in os.listdir(year_path):
-                        pdf_dir_path = os.path.join(year_path, pdf_dir)
-                        if not os.path.isdir(pdf_dir_path):
-                            continue
-                            
-                        category_counts = {}
-                        
-                        # Count JSON files by category
-                        for root, _, files in os.walk(pdf_dir_path):
-                            for file in files:
-                                if file.endswith('.json'):
-                                    try:
-                                        with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
-                                            data = json.load(f)
-                                            
-                                            # Extract categories from direct format
-                                            if 'categories' in data:
-                                                for cat in data.get('categories', []):
-                                                    cat_name = cat.get('name')
-                                                    if cat_name:
-                                                        category_counts[cat_name] = category_counts.get(cat_name, 0) + 1
-                                            
-                                            # Extract categories from choices format
-                                            elif 'choices' in data:
-                                                for choice in data.get('choices', []):
-                                                    content = choice.get('message', {}).get('content', '{}')
-                                                    if content.startswith('```json') and content.endswith('```'):
-                                                        content = content[7:-3].strip()
-                                                    
-                                                    try:
-                                                        content_json = json.loads(content) if isinstance(content, str) else content
-                                                        if 'categories' in content_json:
-                                                            for cat in content_json.get('categories', []):
-                                                                cat_name = cat.get('name')
-                                                                if cat_name:
-                                                                    category_counts[cat_name] = category_counts.get(cat_name, 0) + 1
-                                                    except:
-                                                        continue
-                                    except Exception as e:
-                                        print(f"Error reading {os.path.join(root, file)}: {str(e)}")
-                                        continue
-                        
-                        if category_counts:
-                            year_data[pdf_dir] = {
-                                "category": category_counts
-                            }
-                    
-                    if year_data:
-                        report_data["years"][year] = year_data
-                
-                if report_data["years"]:
-                    client_data["report_types"][report_type] = report_data
-            
-            if client_data["report_types"]:
-                metadata["clients"].append(client_data)
+@app.route('/catalog', methods=['GET'])
+def get_catalog():
+    """One level of the dashboard tree with counts: clients → report types → years → PDFs → categories.
+
+    The level defaults to the children of the deepest parameter given (client, report_type, year,
+    pdf_name); level=categories aggregates categories over everything matched so far, e.g. several
+    years. Pages of at most limit items are returned with next_cursor.
+    """
+    try:
+        client = request.args.get('client')
+        report_type = request.args.get('report_type')
+        years = request.args.getlist('year')
+        pdf_name = request.args.get('pdf_name')
+        cursor = request.args.get('cursor')
+        
+        given = [bool(client), bool(report_type), bool(years), bool(pdf_name)]
+        depth = len(given) - given[::-1].index(True) if any(given) else 0
+        if not all(given[:depth]):
+            return jsonify({"error": "client, report_type, year and pdf_name must be given in that order"}), 400
+        level = request.args.get('level', CATALOG_LEVELS[depth])
+        if level not in CATALOG_LEVELS or CATALOG_LEVELS.index(level) < depth:
+            return jsonify({"error": f"Invalid level for the given parameters: {level}"}), 400
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            return jsonify({"error": "Invalid limit"}), 400
+        if not 1 <= limit <= MAX_RESULTS_PAGE_SIZE:
+            return jsonify({"error": f"limit must be between 1 and {MAX_RESULTS_PAGE_SIZE}"}), 400
         
-        return jsonify(metadata)
+        def build():
+            rows = catalog_children(level, client, report_type, years, pdf_name, after=cursor, limit=limit + 1)
+            if level == 'categories':
+                items = [{"name": row[0], "pages": row[1]} for row in rows]
+            else:
+                items = [{"name": row[0], "pdfs": row[1], "total_pages": row[2], "analyzed_pages": row[3]}
+                         for row in rows]
+            next_cursor = items[limit - 1]["name"] if len(items) > limit else None
+            return {"level": level, "items": items[:limit], "next_cursor": next_cursor}
+        
+        key = json.dumps(['catalog', level, client, report_type, sorted(years), pdf_name, cursor, limit])
+        return materialized_view(key, build)
         
     except Exception as e:
-        return jsonify({"error": f"Failed to generate metadata: {str(e)}"}), 500
+        return jsonify({"error": f"Failed to load catalog: {str(e)}"}), 500
 
 @app.route('/test')
 def test_route():
@@ -640,7 +578,7 @@ def test_route():
 @app.route('/processed/<path:filename>')
 def serve_processed(filename):
     processed_dir = os.path.join(os.path.dirname(__file__), 'processed')
-    return send_from_directory(processed_dir, filename)
+    return send_artifact(processed_dir, filename)
 
 @app.route('/get-json', methods=['GET'])
 def get_json_file():
@@ -660,17 +598,11 @@ def get_json_file():
             return jsonify({"error": f"Missing required parameters: {', '.join(missing)}"}), 400
             
         # Construct the file path
-        json_path = os.path.join(
-            os.path.dirname(__file__), 
-            'processed', 
-            client, 
-            report_type, 
-            year, 
-            pdf_name, 
-            f"{category}.json"
-        )
-        
-        print(f"Looking for JSON file at: {json_path}")
+        processed_dir = os.path.join(os.path.dirname(__file__), 'processed')
+        relative_path = f"{client}/{report_type}/{year}/{pdf_name}/{category}.json"
+        json_path = safe_join(processed_dir, relative_path)
+        if json_path is None:
+            return jsonify({"error": f"Invalid path: {relative_path}"}), 400
         
         # Check if directory exists
         dir_path = os.path.dirname(json_path)
@@ -678,29 +610,13 @@ def get_json_file():
             print(f"Directory does not exist: {dir_path}")
             return jsonify({"error": f"Directory not found: {dir_path}"}), 404
         
-        # List files in directory to help debug
-        print(f"Files in directory {dir_path}:")
-        if os.path.exists(dir_path):
-            for file in os.listdir(dir_path):
-                print(f"  - {file}")
-        
         # Check if file exists
         if not os.path.exists(json_path):
             print(f"JSON file not found: {json_path}")
-            
-            # Try to find similar files
-            similar_files = [f for f in os.listdir(dir_path) if f.endswith('.json')]
-            if similar_files:
-                print(f"Found similar JSON files: {', '.join(similar_files)}")
-            
             return jsonify({"error": f"JSON file not found: {json_path}"}), 404
             
-        # Read and return the JSON file
-        print(f"Found JSON file, attempting to read: {json_path}")
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(f"Successfully read JSON file with {len(str(data))} characters")
-            return jsonify(data)
+        # Served as stored: validated by ETag and compressed, without parsing it again
+        return send_artifact(processed_dir, relative_path)
             
     except Exception as e:
         import traceback
@@ -708,6 +624,58 @@ def get_json_file():
         print(traceback.format_exc())
         return jsonify({"error": f"Failed to retrieve JSON file: {str(e)}"}), 500
 
+@app.route('/get-json-batch', methods=['GET'])
+def get_json_batch():
+    """Processed JSON of several categories of one PDF in a single response"""
+    try:
+        client = request.args.get('client')
+        report_type = request.args.get('report_type')
+        year = request.args.get('year')
+        pdf_name = request.args.get('pdf_name')
+        categories = request.args.getlist('category')
+        
+        if not all([client, report_type, year, pdf_name, categories]):
+            missing = [p for p, v in {'client': client, 'report_type': report_type, 'year': year, 'pdf_name': pdf_name, 'category': categories}.items() if not v]
+            return jsonify({"error": f"Missing required parameters: {', '.join(missing)}"}), 400
+        
+        processed_dir = os.path.join(os.path.dirname(__file__), 'processed')
+        found = {}
+        not_found = []
+        for category in dict.fromkeys(categories):
+            json_path = safe_join(processed_dir, client, report_type, year, pdf_name, f"{category}.json")
+            if json_path is None or not os.path.isfile(json_path):
+                not_found.append(category)
+            else:
+                found[category] = json_path
+        
+        # Validator derived from the member files, so unchanged categories cost a 304
+        members = [f"{category}:{file_etag(path)}" for category, path in found.items()] + not_found
+        etag = hashlib.sha1('|'.join(members).encode('utf-8')).hexdigest()
+        encoding = negotiate_encoding(request.accept_encodings)
+        representation_etag = f"{etag}-{encoding}" if encoding else etag
+        if request.if_none_match.contains(representation_etag):
+            response = Response(status=304)
+        else:
+            # Splice the stored files in as they are instead of parsing and re-serializing them
+            parts = []
+            for category, path in found.items():
+                with open(path, 'rb') as f:
+                    parts.append(json.dumps(category).encode('utf-8') + b': ' + f.read())
+            body = (b'{"results": {' + b', '.join(parts) + b'}, "missing": '
+                    + json.dumps(not_found).encode('utf-8') + b'}')
+            if encoding:
+                body = compress(body, encoding)
+            response = Response(body, mimetype='application/json')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(representation_etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
+    except Exception as e:
+        return jsonify({"error": f"Failed to retrieve JSON files: {str(e)}"}), 500
+
 # Add this near other route definitions
 @app.route('/upload-progress', methods=['GET'])
 def upload_progress():
@@ -717,11 +685,22 @@ def upload_progress():
         'progress': upload_progress  # This would come from your progress tracking implementation
     })
 
+def create_app():
+    """WSGI entry point (gunicorn 'app:create_app()').
+
+    Importing this module only registers routes: it starts no observers and opens no database
+    connection, so gunicorn can preload it once in the master and fork workers from it. Directory
+    watching and page analysis run in ingest_daemon.py, a single process for all workers.
+    """
+    return app
+
 if __name__ == '__main__':
-    # Process existing PDFs
+    # Single-process runs watch directories themselves unless a separate ingestion daemon is used
     # Modified condition to run in both development and production modes
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or os.environ.get('PRODUCTION_MODE', 'false').lower() == 'true':
-        threading.Thread(target=extract_handler.process_existing_pdfs, daemon=True).start()
+        if os.environ.get('INGESTION_MODE', 'embedded').lower() == 'embedded':
+            from ingest_daemon import start_ingestion
+            start_ingestion()
     
     # Check if running in production mode
     production_mode = os.environ.get('PRODUCTION_MODE', 'false').lower() == 'true'
@@ -731,11 +710,9 @@ if __name__ == '__main__':
         from waitress import serve
         port = int(os.environ.get('PORT', 5001))  # Get port from environment or default to 5001
         print(f"Starting server in PRODUCTION mode on port {port}")
-        # Remove this line as it's now handled above
-        # threading.Thread(target=extract_handler.process_existing_pdfs, daemon=True).start()
-        serve(app, host='0.0.0.0', port=port, threads=8)
+        serve(create_app(), host='0.0.0.0', port=port, threads=8)
     else:
         # Development mode
         port = 5000  # Always use port 5000 for development
         print(f"Starting server in DEVELOPMENT mode on port {port}")
-        app.run(debug=True, port=port, host='0.0.0.0')
+        create_app().run(debug=True, port=port, host='0.0.0.0')
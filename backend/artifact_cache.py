@@ -0,0 +1,90 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+try:
+    import brotli  # Optional; gzip is always available
+except ImportError:
+    brotli = None
+
+# Compressed copies of served JSON artifacts: backend/compressed/<path relative to backend>.gz|.br
+# Kept out of jsons/ and processed/ so directory walks there only ever see the originals.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPRESSED_DIR = os.path.join(BACKEND_DIR, 'compressed')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz')) if brotli is not None else (('gzip', '.gz'),)
+
+ETAG_CACHE_ENTRIES = int(os.environ.get('ETAG_CACHE_ENTRIES', 20000))  # Paths whose ETag is remembered, LRU
+
+_etags = OrderedDict()  # path -> (mtime_ns, size, etag), least recently used first
+_etags_lock = threading.Lock()
+
+def file_etag(path: str) -> str:
+    """Strong ETag (content hash) of a file, recomputed only when its mtime or size changes"""
+    stat = os.stat(path)
+    with _etags_lock:
+        cached = _etags.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _etags.move_to_end(path)
+            return cached[2]
+        _etags.pop(path, None)  # Stale; recomputed below
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+    with _etags_lock:
+        _etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        while len(_etags) > ETAG_CACHE_ENTRIES:
+            _etags.popitem(last=False)
+    return etag
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=6)
+
+def compressed_path(path: str, suffix: str):
+    """Where the compressed copy of a file under backend/ lives, or None for files elsewhere"""
+    rel_path = os.path.relpath(os.path.abspath(path), BACKEND_DIR)
+    if rel_path.startswith('..'):
+        return None
+    return os.path.join(COMPRESSED_DIR, rel_path + suffix)
+
+def precompress(path: str):
+    """Write compressed copies of a freshly written artifact so the first request doesn't pay for it"""
+    try:
+        with open(path, 'rb') as f:
+            body = f.read()
+        for encoding, suffix in ENCODINGS:
+            target = compressed_path(path, suffix)
+            if target is None:
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compress(body, encoding))
+            os.replace(tmp_path, target)
+    except OSError as e:
+        print(f"Could not precompress {path}: {str(e)}")
+
+def compressed_body(path: str, encoding: str) -> bytes:
+    """Compressed contents of a file, from its precompressed copy when that is up to date"""
+    suffix = dict(ENCODINGS)[encoding]
+    target = compressed_path(path, suffix)
+    if target and os.path.exists(target) and os.stat(target).st_mtime_ns >= os.stat(path).st_mtime_ns:
+        with open(target, 'rb') as f:
+            return f.read()
+    precompress(path)
+    if target and os.path.exists(target):
+        with open(target, 'rb') as f:
+            return f.read()
+    with open(path, 'rb') as f:
+        return compress(f.read(), encoding)
+
+def negotiate_encoding(accept_encoding) -> str:
+    """Best encoding we can produce that the client accepts, or None for identity"""
+    for encoding, _ in ENCODINGS:
+        if accept_encoding[encoding] > 0:
+            return encoding
+    return None
@@ -1,6 +1,17 @@
+import gc
+
 bind = "0.0.0.0:5001"
 workers = 4
 timeout = 120
 graceful_timeout = 120
 keepalive = 5
-log_level = "debug"
\ No newline at end of file
+log_level = "debug"
+
+# Load the app once in the master and fork workers from it; start with 'app:create_app()'.
+# Directory watching and page analysis run in ingest_daemon.py, never in the workers.
+preload_app = True
+
+def when_ready(server):
+    # Move everything loaded so far out of the collector's reach, so GC passes in the workers
+    # don't touch (and thereby copy) the shared pages
+    gc.freeze()
@@ -16,6 +16,10 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import API_URL, API_KEY, MODEL_NAME, QWEN_PROMPT
 from typing import Dict, Optional
+from page_manifest import update_manifest, page_number_from_path
+from page_normalizer import ingest_page_response
+from artifact_cache import precompress
+from results_db import upsert_page
 
 def analyze_image_with_qwen(image_path: str, file_info: Dict, request_semaphore) -> Optional[Dict]:
     """Send image to Qwen API for analysis and categorization."""
@@ -132,7 +136,21 @@ You are analyzing a {document_type} report document.
             
             with open(json_path, 'w') as f:
                 json.dump(result, f, indent=2)
+            precompress(json_path)
             print(f"Results saved successfully")
+
+            # Validate the model output once; readers use the canonical record instead of re-parsing
+            record = ingest_page_response(json_path, result)
+
+            # Record the page in the PDF's manifest and the results database so readers don't rescan the JSONs
+            page_num = page_number_from_path(image_path)
+            if page_num is not None:
+                update_manifest(file_info['client'], file_info['report_type'], file_info['year'],
+                                os.path.splitext(file_info['filename'])[0], page_num, image_path, json_path,
+                                record['category_names'])
+                upsert_page(file_info['client'], file_info['report_type'], file_info['year'],
+                            os.path.splitext(file_info['filename'])[0], page_num, json_path, image_path,
+                            result, record)
                 
             return result
             
@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import signal
+import threading
+from watchdog.observers import Observer
+try:
+    import fcntl  # Unix file locking
+except ImportError:
+    fcntl = None
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extract_handler import ExtractHandler
+from upload_handler import UploadHandler
+from results_db import is_empty, rebuild_from_disk
+from request_limiter import qwen_requests
+
+# The only process that watches uploads/ and extracts/. Web workers just serve what it writes, so
+# every page is rendered and analyzed exactly once however many workers gunicorn runs.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BACKEND_DIR, 'uploads')
+EXTRACTS_DIR = os.path.join(BACKEND_DIR, 'extracts')
+LOCK_PATH = os.path.join(BACKEND_DIR, 'logs', 'ingest_daemon.lock')
+
+_lock_file = None
+
+def acquire_singleton_lock() -> bool:
+    """Hold an exclusive lock for the life of the process; False if another daemon already has it"""
+    global _lock_file
+    if fcntl is None:
+        return True  # No file locking available; rely on running a single daemon
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    _lock_file = open(LOCK_PATH, 'w')
+    try:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        _lock_file.close()
+        _lock_file = None
+        return False
+    _lock_file.write(str(os.getpid()))
+    _lock_file.flush()
+    return True
+
+def start_ingestion():
+    """Start the upload and extract observers plus the startup catch-up work; returns the observers"""
+    if not acquire_singleton_lock():
+        print(f"Another ingestion daemon holds {LOCK_PATH}; not watching directories in this process")
+        return []
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(EXTRACTS_DIR, exist_ok=True)
+
+    # Page analysis shares the QWEN_MAX_CONCURRENT_REQUESTS cap with the category subprocesses
+    extract_handler = ExtractHandler(qwen_requests)
+    upload_handler = UploadHandler(UPLOAD_FOLDER)
+    upload_handler.recently_processed = {}
+
+    extracts_observer = Observer()
+    extracts_observer.schedule(extract_handler, path=EXTRACTS_DIR, recursive=True)
+    print(f"Starting extracts observer with recursive=True on {EXTRACTS_DIR}")
+    extracts_observer.start()
+
+    upload_observer = Observer()
+    upload_observer.schedule(upload_handler, path=UPLOAD_FOLDER, recursive=True)
+    upload_observer.start()
+
+    # Import analyses that predate the results database in the background
+    if is_empty():
+        threading.Thread(target=rebuild_from_disk, daemon=True).start()
+    threading.Thread(target=extract_handler.process_existing_pdfs, daemon=True).start()
+    return [extracts_observer, upload_observer]
+
+def main():
+    observers = start_ingestion()
+    if not observers:
+        sys.exit(1)
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    print(f"Ingestion daemon running with PID {os.getpid()}")
+    try:
+        while not stopping.is_set():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    print("Stopping ingestion daemon")
+    for observer in observers:
+        observer.stop()
+    for observer in observers:
+        observer.join()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import re
+import json
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl  # Unix file locking, shared with the category processing subprocess
+except ImportError:
+    fcntl = None
+from page_normalizer import load_normalized
+
+# One manifest per PDF: backend/manifests/<client>/<report_type>/<year>/<pdf_name>.json
+# Paths inside the manifest are relative to the backend directory
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFESTS_DIR = os.path.join(BACKEND_DIR, 'manifests')
+PAGE_NUMBER = re.compile(r'_page_(\d+)$')
+
+_manifest_lock = threading.Lock()
+
+def manifest_path(client: str, report_type: str, year: str, pdf_name: str) -> str:
+    return os.path.join(MANIFESTS_DIR, client, report_type, year, f"{pdf_name}.json")
+
+def page_number_from_path(path: str):
+    """Page number from an extract/JSON filename like ar2024_page_12.jpg, or None"""
+    match = PAGE_NUMBER.search(os.path.splitext(os.path.basename(path))[0])
+    return int(match.group(1)) if match else None
+
+@contextmanager
+def _locked(path: str):
+    """Serialize read-modify-write of one manifest across threads and, where possible, processes"""
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write(path: str, manifest: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    manifest['updated_at'] = datetime.now().isoformat()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def load_manifest(client: str, report_type: str, year: str, pdf_name: str):
+    path = manifest_path(client, report_type, year, pdf_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest {path}: {str(e)}")
+        return None
+
+def update_manifest(client: str, report_type: str, year: str, pdf_name: str, page: int,
+                    image_path: str, json_path: str, categories: list):
+    """Record one analyzed page; called right after its JSON is written"""
+    path = manifest_path(client, report_type, year, pdf_name)
+    with _locked(path):
+        # A PDF analyzed before manifests existed starts from its scanned pages, not from this one alone
+        manifest = (load_manifest(client, report_type, year, pdf_name)
+                    or _scan_manifest(client, report_type, year, pdf_name)
+                    or {'client': client, 'report_type': report_type, 'year': year, 'pdf_name': pdf_name, 'pages': {}})
+        manifest['pages'][str(page)] = {
+            'page': page,
+            'image_path': os.path.relpath(image_path, BACKEND_DIR),
+            'json_path': os.path.relpath(json_path, BACKEND_DIR),
+            'categories': categories
+        }
+        _write(path, manifest)
+    return manifest
+
+def _scan_manifest(client: str, report_type: str, year: str, pdf_name: str):
+    """Manifest of a PDF's page JSONs on disk, or None if it has no JSON folder"""
+    json_dir = os.path.join(BACKEND_DIR, 'jsons', client, report_type, year, pdf_name)
+    manifest = {'client': client, 'report_type': report_type, 'year': year, 'pdf_name': pdf_name, 'pages': {}}
+    if not os.path.isdir(json_dir):
+        return None
+    for file in os.listdir(json_dir):
+        if not file.endswith('.json'):
+            continue
+        page = page_number_from_path(file)
+        if page is None:
+            print(f"Warning: Could not extract page number from filename: {file}")
+            continue
+        json_path = os.path.join(json_dir, file)
+        try:
+            categories = load_normalized(json_path)['category_names']
+        except Exception as e:
+            print(f"Error reading {json_path}: {str(e)}")
+            continue
+        image_path = os.path.join(BACKEND_DIR, 'extracts', client, report_type, year, pdf_name,
+                                  f"{os.path.splitext(file)[0]}.jpg")
+        manifest['pages'][str(page)] = {
+            'page': page,
+            'image_path': os.path.relpath(image_path, BACKEND_DIR),
+            'json_path': os.path.relpath(json_path, BACKEND_DIR),
+            'categories': categories
+        }
+    return manifest
+
+def build_manifest(client: str, report_type: str, year: str, pdf_name: str):
+    """Create the manifest for a PDF analyzed before manifests existed by scanning its JSONs once"""
+    path = manifest_path(client, report_type, year, pdf_name)
+    with _locked(path):
+        # Another thread or process may have written it since get_manifest looked
+        manifest = load_manifest(client, report_type, year, pdf_name)
+        if manifest is not None:
+            return manifest
+        manifest = _scan_manifest(client, report_type, year, pdf_name)
+        if manifest is None:
+            return None
+        _write(path, manifest)
+    print(f"Built manifest for {client}/{report_type}/{year}/{pdf_name} ({len(manifest['pages'])} pages)")
+    return manifest
+
+def get_manifest(client: str, report_type: str, year: str, pdf_name: str):
+    """Load a PDF's manifest, building it from the page JSONs the first time"""
+    return (load_manifest(client, report_type, year, pdf_name)
+            or build_manifest(client, report_type, year, pdf_name))
+
+def group_pages_by_category(manifest: dict) -> dict:
+    """{normalized category name: [page entries in page order]} with absolute paths"""
+    grouped = {}
+    for entry in sorted(manifest.get('pages', {}).values(), key=lambda e: e['page']):
+        for name in entry.get('categories', []):
+            cat_name = name.replace(' ', '_').lower()
+            grouped.setdefault(cat_name, []).append({
+                'page': entry['page'],
+                'source_file': os.path.join(BACKEND_DIR, entry['json_path']),
+                'image_path': os.path.join(BACKEND_DIR, entry['image_path'])
+            })
+    return grouped
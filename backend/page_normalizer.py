@@ -0,0 +1,138 @@
+import os
+import json
+from typing import Dict, Optional, Tuple
+
+# Canonical page records live in backend/normalized/, mirroring the raw responses under backend/jsons/.
+# They are kept out of jsons/ so directory walks that count page JSONs are unaffected.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+JSONS_DIR = os.path.join(BACKEND_DIR, 'jsons')
+NORMALIZED_DIR = os.path.join(BACKEND_DIR, 'normalized')
+SCHEMA_VERSION = 1
+
+def strip_fences(content: str) -> str:
+    """Remove a surrounding ```json ... ``` (or bare ```) markdown fence"""
+    content = content.strip()
+    if content.startswith('```') and content.endswith('```') and len(content) >= 6:
+        content = content[3:-3].strip()
+        if content[:4].lower() == 'json':
+            content = content[4:].lstrip()
+    return content
+
+def parse_model_output(data: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """(content_json, error) for a raw Qwen response in either the direct or the choices format"""
+    if not isinstance(data, dict):
+        return None, f"Expected a JSON object, got {type(data).__name__}"
+    if 'categories' in data:
+        return data, None
+    if 'choices' not in data:
+        return None, "Response has neither 'categories' nor 'choices'"
+    try:
+        content = data['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError) as e:
+        return None, f"Missing choices[0].message.content: {e}"
+    if isinstance(content, str):
+        try:
+            content = json.loads(strip_fences(content))
+        except json.JSONDecodeError as e:
+            return None, f"Model content is not valid JSON: {e}"
+    if not isinstance(content, dict):
+        return None, f"Model content is a {type(content).__name__}, not an object"
+    return content, None
+
+def _normalize_table(table, warnings):
+    if not isinstance(table, dict):
+        warnings.append("Dropped table that is not an object")
+        return None
+    rows = table.get('rows') if isinstance(table.get('rows'), list) else []
+    return {
+        'title': table.get('title') if isinstance(table.get('title'), str) else '',
+        'headers': [str(h) for h in table.get('headers', [])] if isinstance(table.get('headers'), list) else [],
+        'rows': [row if isinstance(row, list) else [row] for row in rows]
+    }
+
+def _normalize_category(category, warnings):
+    if not isinstance(category, dict):
+        warnings.append("Dropped category that is not an object")
+        return None
+    name = category.get('name')
+    if not isinstance(name, str) or not name.strip():
+        warnings.append("Dropped category without a name")
+        return None
+    confidence = category.get('confidence')
+    if not isinstance(confidence, (int, float)) or isinstance(confidence, bool):
+        confidence = None
+    content = category.get('content') if isinstance(category.get('content'), dict) else {}
+    key_figures = content.get('key_figures') if isinstance(content.get('key_figures'), list) else []
+    tables = content.get('tables') if isinstance(content.get('tables'), list) else []
+    return {
+        'name': name.strip(),
+        'confidence': confidence,
+        'content': {
+            'text': content.get('text') if isinstance(content.get('text'), str) else '',
+            'key_figures': [f for f in key_figures if isinstance(f, dict)],
+            'tables': [t for t in (_normalize_table(t, warnings) for t in tables) if t is not None]
+        }
+    }
+
+def normalize_page_response(data: Dict) -> Dict:
+    """Validate a raw Qwen page response against the QWEN_PROMPT schema and return the canonical record.
+
+    The record always has the same shape; anything that could not be parsed is reported in
+    parse_error (the whole response) or warnings (individual entries that were dropped).
+    """
+    content_json, error = parse_model_output(data)
+    warnings = []
+    categories = []
+    report_type = None
+    if content_json is not None:
+        raw_categories = content_json.get('categories', [])
+        if not isinstance(raw_categories, list):
+            error = f"'categories' is a {type(raw_categories).__name__}, not a list"
+            raw_categories = []
+        categories = [c for c in (_normalize_category(c, warnings) for c in raw_categories) if c is not None]
+        if content_json.get('report_type') in ('annual', 'quarterly'):
+            report_type = content_json['report_type']
+    return {
+        'schema_version': SCHEMA_VERSION,
+        'report_type': report_type,
+        'categories': categories,
+        'category_names': [c['name'] for c in categories],
+        'parse_error': error,
+        'warnings': warnings
+    }
+
+def normalized_path(json_path: str) -> str:
+    """Location of the canonical record for a raw response under jsons/"""
+    rel_path = os.path.relpath(os.path.abspath(json_path), JSONS_DIR)
+    return os.path.join(NORMALIZED_DIR, rel_path)
+
+def write_normalized(json_path: str, record: Dict) -> str:
+    path = normalized_path(json_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+def ingest_page_response(json_path: str, data: Dict) -> Dict:
+    """Normalize a freshly written raw response once, store the record and report problems once"""
+    record = normalize_page_response(data)
+    write_normalized(json_path, record)
+    if record['parse_error']:
+        print(f"Could not parse model output for {json_path}: {record['parse_error']}")
+    for warning in record['warnings']:
+        print(f"Normalization warning for {json_path}: {warning}")
+    return record
+
+def load_normalized(json_path: str) -> Optional[Dict]:
+    """Canonical record for a raw response; new or rewritten responses are (re)ingested on first read"""
+    path = normalized_path(json_path)
+    raw_exists = os.path.exists(json_path)
+    if os.path.exists(path) and (not raw_exists or os.stat(path).st_mtime_ns >= os.stat(json_path).st_mtime_ns):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if not raw_exists:
+        return None
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return ingest_page_response(json_path, json.load(f))
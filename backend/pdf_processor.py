@@ -2,6 +2,8 @@ import os
 import fitz  # PyMuPDF for PDF processing
 import time
 from typing import Dict
+from results_db import set_pdf_pages
+from thumbnails import schedule_thumbnails, schedule_sprite
 
 def process_pdf_with_qwen(file_info: Dict):
     """Process PDF and extract images without analyzing them"""
@@ -61,7 +63,11 @@ def process_pdf_with_qwen(file_info: Dict):
             )
             
             print(f"Page {page_num+1} processed successfully (size: {os.path.getsize(image_path)/1024:.1f} KB)")
+            schedule_thumbnails(image_path)  # Small WebP previews, generated in the background
         
+        set_pdf_pages(file_info['client'], file_info['report_type'], file_info['year'],
+                      os.path.splitext(file_info['filename'])[0], len(pdf_document))
+        schedule_sprite(extracts_dir)
         pdf_document.close()
         print(f"Completed processing: {file_info['path']}")
         # The ExtractHandler will detect these new images and analyze them
@@ -102,12 +102,9 @@ def process_specific_image(image_path: str):
                 'year': year
             }
             
-            # Create a semaphore for rate limiting
-            from threading import Semaphore
-            request_semaphore = Semaphore(3)  # Same as MAX_CONCURRENT_REQUESTS in app.py
-            
-            # Process using existing handler logic
-            analyze_image_with_qwen(image_path, file_info, request_semaphore)
+            # Process using existing handler logic, within the machine-wide Qwen request cap
+            from request_limiter import qwen_requests
+            analyze_image_with_qwen(image_path, file_info, qwen_requests)
             
         else:
             print(f"Skipping image with unexpected path structure: {image_path}")
@@ -0,0 +1,66 @@
+import os
+import time
+import threading
+try:
+    import fcntl  # Unix file locking, shared by the daemon and its category processing subprocesses
+except ImportError:
+    fcntl = None
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import MAX_CONCURRENT_REQUESTS
+
+# One slot file per allowed request: backend/logs/limits/<name>.<n>.lock. A request holds an
+# exclusive lock on a free slot for its duration, so the cap covers every process on the machine,
+# and the OS releases the lock if a process dies mid-request.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+LIMITS_DIR = os.path.join(BACKEND_DIR, 'logs', 'limits')
+POLL_SECONDS = 0.2
+
+class SharedSemaphore:
+    """Context manager like threading.Semaphore whose count is shared across processes by name.
+
+    Without fcntl (Windows) it only limits the threads of this process.
+    """
+
+    def __init__(self, name: str, value: int, lock_dir: str = LIMITS_DIR):
+        self.value = max(1, value)
+        self.local = threading.Semaphore(self.value)  # Threads of this process wait here, not by polling
+        self.paths = [os.path.join(lock_dir, f"{name}.{slot}.lock") for slot in range(self.value)]
+        self.held = threading.local()
+
+    def _lock_slot(self):
+        while True:
+            for path in self.paths:
+                lock_file = open(path, 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return lock_file
+                except OSError:
+                    lock_file.close()
+            time.sleep(POLL_SECONDS)
+
+    def __enter__(self):
+        self.local.acquire()
+        if fcntl is None:
+            return self
+        try:
+            os.makedirs(os.path.dirname(self.paths[0]), exist_ok=True)
+            lock_file = self._lock_slot()
+        except BaseException:
+            self.local.release()
+            raise
+        self.held.__dict__.setdefault('files', []).append(lock_file)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                lock_file = self.held.files.pop()
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+        finally:
+            self.local.release()
+        return False
+
+# In-flight Qwen calls of the ingest daemon, its category subprocesses and the maintenance scripts
+qwen_requests = SharedSemaphore('qwen', MAX_CONCURRENT_REQUESTS)
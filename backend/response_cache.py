@@ -0,0 +1,52 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ResponseCache:
+    """LRU of serialized response bodies, bounded by total size and validated by a generation number.
+
+    Entries are tagged with the results database generation they were built from, so a write
+    anywhere invalidates them without stat-ing files. ETags are derived from the generation and
+    the cache key only, which makes them identical across gunicorn workers: any worker can answer
+    a conditional request with 304 even if it never built that response itself.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()  # key -> (generation, etag, body)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_etag(key: str, generation: int) -> str:
+        return hashlib.sha1(f"{generation}:{key}".encode('utf-8')).hexdigest()
+
+    def get(self, key: str, generation: int):
+        """Return (etag, body) if cached for this generation, else None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != generation:
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: str, generation: int, body: bytes) -> str:
+        etag = self.make_etag(key, generation)
+        if len(body) > self.max_bytes:
+            return etag  # Too large to keep; still usable as a validator
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (generation, etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+        return etag
+
+    def _remove(self, key: str):
+        _, _, body = self.entries.pop(key)
+        self.size -= len(body)
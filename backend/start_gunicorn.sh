@@ -1,4 +1,7 @@
 #!/bin/bash
 sudo pkill -f gunicorn
+sudo pkill -f ingest_daemon.py
 cd /home/chartnexus/ai_ir/backend
-gunicorn -c /home/chartnexus/ai_ir/backend/gunicorn_config.py app:app
\ No newline at end of file
+# One ingestion process for the whole deployment; the web workers only serve
+nohup python ingest_daemon.py > logs/ingest.log 2>&1 &
+gunicorn -c /home/chartnexus/ai_ir/backend/gunicorn_config.py 'app:create_app()'
@@ -0,0 +1,95 @@
+import os
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from page_manifest import page_number_from_path
+
+# Thumbnails live next to their page images:
+#   extracts/<client>/<report_type>/<year>/<pdf>/thumbs/<size>/<pdf>_page_<n>.webp
+# WebP output and the thumbs/ subdirectory keep them invisible to the .jpg/.png extract watchers.
+THUMBNAIL_SIZES = (160, 480)  # Longest edge in pixels
+THUMBNAIL_QUALITY = 80
+SPRITE_SIZE = 160
+BUILD_SPRITES = os.getenv('BUILD_THUMBNAIL_SPRITES', 'false').lower() == 'true'
+
+# A single worker keeps generation off the rendering path and runs a PDF's sprite after its pages
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+
+def thumbnail_path(image_path: str, size: int) -> str:
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    return os.path.join(os.path.dirname(image_path), 'thumbs', str(size), f"{base_name}.webp")
+
+def sprite_paths(pdf_dir: str, size: int = SPRITE_SIZE):
+    """(image, index) paths of a PDF's sprite sheet"""
+    base = os.path.join(pdf_dir, 'thumbs', f"sprite_{size}")
+    return f"{base}.webp", f"{base}.json"
+
+def _is_fresh(path: str, source: str) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
+
+def _save_webp(image: Image.Image, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+    os.replace(tmp_path, path)
+
+def make_thumbnails(image_path: str, sizes=THUMBNAIL_SIZES) -> dict:
+    """Write any missing or stale thumbnails of a page image; returns {size: path}"""
+    paths = {size: thumbnail_path(image_path, size) for size in sizes}
+    stale = [size for size, path in paths.items() if not _is_fresh(path, image_path)]
+    if stale:
+        with Image.open(image_path) as image:
+            image = image.convert('L' if image.mode in ('1', 'L') else 'RGB')
+            # Largest first, so each smaller size is resampled from the previous one
+            for size in sorted(stale, reverse=True):
+                image.thumbnail((size, size), Image.LANCZOS)
+                _save_webp(image, paths[size])
+    return paths
+
+def get_thumbnail(image_path: str, size: int) -> str:
+    """Path of a page thumbnail, generating it if the background worker hasn't yet"""
+    return make_thumbnails(image_path, (size,))[size]
+
+def build_sprite(pdf_dir: str, size: int = SPRITE_SIZE) -> dict:
+    """Tile all page thumbnails of a PDF into one WebP with a {page: [x, y, w, h]} index"""
+    pages = sorted((page_number_from_path(f), os.path.join(pdf_dir, f)) for f in os.listdir(pdf_dir)
+                   if f.lower().endswith(('.png', '.jpg', '.jpeg')) and page_number_from_path(f) is not None)
+    sprite_path, index_path = sprite_paths(pdf_dir, size)
+    if not pages:
+        return {'size': size, 'pages': {}}
+    if os.path.exists(index_path) and all(_is_fresh(index_path, path) for _, path in pages):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if len(index['pages']) == len(pages):
+            return index
+    columns = max(1, math.ceil(math.sqrt(len(pages))))
+    rows = math.ceil(len(pages) / columns)
+    sprite = Image.new('RGB', (columns * size, rows * size), 'white')
+    index = {'size': size, 'columns': columns, 'pages': {}}
+    for i, (page, path) in enumerate(pages):
+        with Image.open(get_thumbnail(path, size)) as thumb:
+            x, y = (i % columns) * size, (i // columns) * size
+            sprite.paste(thumb.convert('RGB'), (x, y))
+            index['pages'][str(page)] = [x, y, thumb.width, thumb.height]
+    _save_webp(sprite, sprite_path)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+    return index
+
+def _run(task, *args):
+    try:
+        task(*args)
+    except Exception as e:
+        print(f"Thumbnail generation failed for {args[0]}: {str(e)}")
+
+def schedule_thumbnails(image_path: str):
+    """Queue thumbnail generation for a freshly rendered page"""
+    _executor.submit(_run, make_thumbnails, image_path)
+
+def schedule_sprite(pdf_dir: str):
+    """Queue the sprite sheet of a PDF, if sprites are enabled; runs after its queued pages"""
+    if BUILD_SPRITES:
+        _executor.submit(_run, build_sprite, pdf_dir)
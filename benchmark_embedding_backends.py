@@ -0,0 +1,89 @@
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import numpy as np
+from embedding_service import load_local_model
+from config import EMBEDDING_THREADS
+
+def collect_pages(paths, max_texts=None):
+    """Non-empty page texts from pdf_analysis_summary.json files or directories containing them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "pdf_analysis_summary.json"), recursive=True)))
+        elif path.lower().endswith(".json"):
+            files.append(path)
+    texts = []
+    for file in files:
+        with open(file, "r", encoding="utf-8") as f:
+            texts.extend(page["text"] for page in json.load(f) if page["text"].strip())
+    return texts[:max_texts] if max_texts else texts
+
+def sample_queries(texts, count, seed=0):
+    """Pseudo-questions: the opening words of randomly chosen pages"""
+    rng = random.Random(seed)
+    picks = rng.sample(texts, min(count, len(texts)))
+    return [" ".join(text.split()[:12]) for text in picks]
+
+def timed_encode(encoder, texts, batch_size):
+    start = time.perf_counter()
+    embeddings = np.asarray(encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32)
+    return embeddings, time.perf_counter() - start
+
+def top_k(query_embeddings, page_embeddings, k):
+    # Both backends return L2-normalized vectors, so the dot product is the cosine similarity
+    scores = query_embeddings @ page_embeddings.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fp32 torch and int8 ONNX sentence embeddings")
+    parser.add_argument("paths", nargs="+", help="pdf_analysis_summary.json files or directories to scan")
+    parser.add_argument("--max-texts", type=int, default=2000, help="Pages to encode")
+    parser.add_argument("--queries", type=int, default=100, help="Sampled queries for retrieval agreement")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=EMBEDDING_THREADS)
+    args = parser.parse_args()
+
+    texts = collect_pages(args.paths, args.max_texts)
+    if not texts:
+        print("No page texts found")
+        sys.exit(1)
+    queries = sample_queries(texts, args.queries)
+    print(f"Encoding {len(texts)} pages and {len(queries)} queries with {args.threads} threads")
+
+    results = {}
+    for backend in ("torch", "onnx"):
+        try:
+            encoder = load_local_model(args.threads, backend)
+        except (RuntimeError, FileNotFoundError, ImportError) as e:
+            print(f"  {backend:<6} skipped: {e}")
+            continue
+        encoder.encode(texts[:args.batch_size], batch_size=args.batch_size)  # Warm-up
+        pages, seconds = timed_encode(encoder, texts, args.batch_size)
+        query_embeddings, _ = timed_encode(encoder, queries, args.batch_size)
+        results[backend] = (pages, query_embeddings, seconds)
+        print(f"  {backend:<6} {len(texts) / seconds:8.1f} texts/sec  ({seconds:.1f}s)")
+
+    if "torch" not in results or "onnx" not in results:
+        print("Need both backends to compare retrieval agreement")
+        sys.exit(1)
+
+    reference_pages, reference_queries, reference_seconds = results["torch"]
+    pages, query_embeddings, seconds = results["onnx"]
+    k = min(args.k, len(texts))
+    reference_top = top_k(reference_queries, reference_pages, k)
+    # Queries are embedded by each backend against its own page vectors, as a real index would be
+    candidate_top = top_k(query_embeddings, pages, k)
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top, candidate_top)]
+    top1 = np.mean(reference_top[:, 0] == candidate_top[:, 0])
+    cosine = np.sum(reference_pages * pages, axis=1)
+
+    print(f"\nint8 ONNX vs fp32 torch over {len(texts)} pages and {len(queries)} queries")
+    print(f"{'speedup':>10} {'top-' + str(k) + ' overlap':>15} {'top-1 agree':>12} {'mean cos':>9} {'min cos':>8}")
+    print(f"{reference_seconds / seconds:9.2f}x {np.mean(overlap):15.3f} {top1:12.3f} "
+          f"{cosine.mean():9.4f} {cosine.min():8.4f}")
@@ -0,0 +1,105 @@
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import argparse
+from collections import Counter
+import pdfplumber
+from export_pdf_full_analysis import EXTRACTION_BACKENDS, export_page_range, fitz
+
+WORD = re.compile(r"\w+")
+
+def token_f1(reference, candidate):
+    """Bag-of-words F1 between two page texts; ignores layout and whitespace differences"""
+    ref_tokens = Counter(WORD.findall(reference.lower()))
+    cand_tokens = Counter(WORD.findall(candidate.lower()))
+    if not ref_tokens and not cand_tokens:
+        return 1.0
+    overlap = sum((ref_tokens & cand_tokens).values())
+    if overlap == 0:
+        return 0.0
+    precision = overlap / sum(cand_tokens.values())
+    recall = overlap / sum(ref_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+def collect_pdfs(paths):
+    pdfs = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdfs.extend(sorted(glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True)))
+        elif path.lower().endswith(".pdf"):
+            pdfs.append(path)
+    return pdfs
+
+def benchmark_pdf(pdf_path, backends, max_pages=None, eager_artifacts=False):
+    """Run every backend over one PDF and return {backend: (seconds, pages, tables, texts)}"""
+    with pdfplumber.open(pdf_path) as pdf:
+        total_pages = len(pdf.pages)
+    last_page = min(max_pages, total_pages) if max_pages else total_pages
+
+    results = {}
+    for backend in backends:
+        output_folder = tempfile.mkdtemp(prefix=f"extract_bench_{backend}_")
+        try:
+            start = time.perf_counter()
+            pages = export_page_range(pdf_path, output_folder, 1, last_page, backend, eager_artifacts)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
+        tables = sum(len(p["tables"]) for p in pages)
+        results[backend] = (elapsed, len(pages), tables, [p["text"] for p in pages])
+        print(f"  {backend:<10} {len(pages) / elapsed if elapsed else 0:8.2f} pages/sec  "
+              f"{tables:4d} tables  ({elapsed:.1f}s)")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare PDF text extraction backends on a sample corpus")
+    parser.add_argument("paths", nargs="+", help="PDF files or directories to scan for PDFs")
+    parser.add_argument("--max-pages", type=int, default=None, help="Only benchmark the first N pages of each PDF")
+    # Tables are what separates the backends, so by default every backend extracts them (and
+    # renders page images) as an eager export would; pdfplumber would skip its tables otherwise
+    parser.add_argument("--lazy-artifacts", action="store_true",
+                        help="Only time text extraction, as a default lazy export does (hybrid still extracts tables)")
+    parser.add_argument("--backends", nargs="+", default=list(EXTRACTION_BACKENDS), choices=EXTRACTION_BACKENDS)
+    args = parser.parse_args()
+
+    backends = args.backends
+    if fitz is None:
+        print("PyMuPDF is not installed, only benchmarking pdfplumber")
+        backends = ["pdfplumber"]
+    # pdfplumber is the reference output that the current indexes were built from
+    if "pdfplumber" not in backends:
+        backends = ["pdfplumber"] + backends
+
+    pdfs = collect_pdfs(args.paths)
+    if not pdfs:
+        print("No PDF files found")
+        sys.exit(1)
+
+    totals = {b: {"seconds": 0.0, "pages": 0, "tables": 0, "f1": []} for b in backends}
+    for pdf_path in pdfs:
+        print(f"Benchmarking {pdf_path}")
+        results = benchmark_pdf(pdf_path, backends, args.max_pages, not args.lazy_artifacts)
+        reference_texts = results["pdfplumber"][3]
+        for backend, (elapsed, pages, tables, texts) in results.items():
+            totals[backend]["seconds"] += elapsed
+            totals[backend]["pages"] += pages
+            totals[backend]["tables"] += tables
+            totals[backend]["f1"].extend(token_f1(ref, text) for ref, text in zip(reference_texts, texts))
+
+    print(f"\nSummary over {len(pdfs)} PDFs (text equivalence is token F1 against pdfplumber)")
+    print(f"{'backend':<10} {'pages/sec':>10} {'speedup':>8} {'tables':>7} {'mean F1':>8} {'min F1':>7} {'pages<0.9':>10}")
+    baseline_rate = None
+    for backend in backends:
+        t = totals[backend]
+        rate = t["pages"] / t["seconds"] if t["seconds"] else 0.0
+        if backend == "pdfplumber":
+            baseline_rate = rate
+        speedup = rate / baseline_rate if baseline_rate else 0.0
+        f1_scores = t["f1"] or [1.0]
+        low_pages = sum(1 for s in f1_scores if s < 0.9)
+        print(f"{backend:<10} {rate:10.2f} {speedup:7.2f}x {t['tables']:7d} "
+              f"{sum(f1_scores) / len(f1_scores):8.3f} {min(f1_scores):7.3f} {low_pages:10d}")
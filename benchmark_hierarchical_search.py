@@ -0,0 +1,57 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+from embedding_service import get_encoder
+from benchmark_embedding_backends import sample_queries
+from update_faiss_index import summary_pages
+from faiss_store import PageIndex
+from config import HIERARCHY_SECTION_PAGES, HIERARCHY_REPORTS, HIERARCHY_SECTIONS
+
+# Latency and recall of report -> section -> page search against flat search over the same PageIndex
+def collect_report_pages(paths):
+    """Pages of every <year>/<report>/pdf_analysis_summary.json under the given directories"""
+    pages = []
+    for path in paths:
+        for file in sorted(glob.glob(os.path.join(path, "**", "pdf_analysis_summary.json"), recursive=True)):
+            report_dir = os.path.dirname(file)
+            pages.extend(summary_pages(file, os.path.basename(os.path.dirname(report_dir)), os.path.basename(report_dir)))
+    return pages
+
+def timed(search, queries, k):
+    start = time.perf_counter()
+    _, labels = search(queries, k)
+    return labels, (time.perf_counter() - start) * 1000 / len(queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare hierarchical and flat page search")
+    parser.add_argument("paths", nargs="+", help="Directories of <year>/<report>/pdf_analysis_summary.json")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-type", default="flat")
+    args = parser.parse_args()
+
+    pages = collect_report_pages(args.paths)
+    if not pages:
+        print("No page texts found")
+        sys.exit(1)
+    encoder = get_encoder()
+    embeddings = encoder.encode([page["text"] for page in pages], convert_to_numpy=True)
+    queries = np.asarray(encoder.encode(sample_queries([page["text"] for page in pages], args.queries),
+                                        convert_to_numpy=True), dtype=np.float32)
+    page_index = PageIndex.build(pages, embeddings, args.index_type)
+    reports = len({(page["year"], page["report"]) for page in pages})
+    k = min(args.k, len(pages))
+    print(f"{len(pages)} pages in {reports} reports, {len(page_index.sections['low'])} sections of "
+          f"{HIERARCHY_SECTION_PAGES} pages, {len(queries)} queries, recall@{k} vs flat search")
+
+    reference, flat_ms = timed(page_index.search, queries, k)
+    print(f"{'search':<24} {'ms/query':>9} {'recall':>7}")
+    print(f"{'flat':<24} {flat_ms:9.3f} {1:7.3f}")
+    settings = sorted({(HIERARCHY_REPORTS, HIERARCHY_SECTIONS), (2, 4), (4, 8), (16, 24)})
+    for top_reports, top_sections in settings:
+        labels, ms = timed(lambda q, n: page_index.search_hierarchical(q, n, top_reports, top_sections), queries, k)
+        recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(reference, labels)])
+        print(f"{f'{top_reports} reports/{top_sections} sections':<24} {ms:9.3f} {recall:7.3f}")
@@ -0,0 +1,56 @@
+import sys
+import time
+import argparse
+import numpy as np
+from embedding_service import get_encoder
+from benchmark_embedding_backends import collect_pages, sample_queries
+from faiss_store import build_index, index_memory_bytes, RerankedIndex
+from config import FAISS_PQ_M, FAISS_RERANK_FACTOR
+
+# Memory vs recall of the compressed index types, measured against exact float32 search
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    k = reference.shape[1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(reference, candidate)]))
+
+def timed_search(index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    _, labels = index.search(queries, k)
+    return labels, (time.perf_counter() - start) * 1000 / len(queries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare flat, SQ8 and PQ page indexes")
+    parser.add_argument("paths", nargs="+", help="pdf_analysis_summary.json files or directories to scan")
+    parser.add_argument("--max-texts", type=int, default=20000, help="Pages to index")
+    parser.add_argument("--queries", type=int, default=200, help="Sampled queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pq-m", type=int, default=FAISS_PQ_M)
+    parser.add_argument("--rerank-factor", type=int, default=FAISS_RERANK_FACTOR)
+    args = parser.parse_args()
+
+    texts = collect_pages(args.paths, args.max_texts)
+    if not texts:
+        print("No page texts found")
+        sys.exit(1)
+    encoder = get_encoder()
+    embeddings = np.asarray(encoder.encode(texts, convert_to_numpy=True), dtype=np.float32)
+    queries = np.asarray(encoder.encode(sample_queries(texts, args.queries), convert_to_numpy=True), dtype=np.float32)
+    k = min(args.k, len(texts))
+    float16 = embeddings.astype(np.float16)
+
+    flat = build_index(embeddings, "flat")
+    reference, flat_ms = timed_search(flat, queries, k)
+    flat_bytes = index_memory_bytes(flat)
+    print(f"{len(texts)} vectors of {embeddings.shape[1]} dims, {len(queries)} queries, recall@{k} vs exact search")
+    print(f"{'index':<14} {'resident':>10} {'ratio':>7} {'+f16 disk':>10} {'recall':>7} {'ms/query':>9}")
+    print(f"{'flat':<14} {flat_bytes / 1e6:8.2f}MB {1:6.1f}x {'-':>10} {1:7.3f} {flat_ms:9.3f}")
+
+    for index_type in ("sq8", "pq"):
+        index = build_index(embeddings, index_type, args.pq_m)
+        size = index_memory_bytes(index)
+        name = index_type if index_type == "sq8" else f"pq{args.pq_m}"
+        rows = [(name, index), (f"{name}+rerank", RerankedIndex(index, float16, args.rerank_factor))]
+        for label, searchable in rows:
+            labels, ms = timed_search(searchable, queries, k)
+            disk = f"{float16.nbytes / 1e6:8.2f}MB" if isinstance(searchable, RerankedIndex) else f"{'-':>10}"
+            print(f"{label:<14} {size / 1e6:8.2f}MB {flat_bytes / size:6.1f}x {disk} "
+                  f"{recall_at_k(reference, labels):7.3f} {ms:9.3f}")
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Each measurement runs in a fresh interpreter, so nothing is already imported or cached in memory.
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, sys, time
+start = time.perf_counter()
+import faiss_chat_api
+imported = time.perf_counter()
+app = faiss_chat_api.create_app()
+created = time.perf_counter()
+client = app.test_client()
+ready = None
+while time.perf_counter() - created < TIMEOUT:
+    if client.get('/ready').status_code == 200:
+        ready = time.perf_counter()
+        break
+    if faiss_chat_api.warmup['state'] == 'failed':
+        break
+    time.sleep(0.05)
+first_query = None
+if ready is not None:
+    query_start = time.perf_counter()
+    faiss_chat_api.load_model().encode(["What was the total revenue last year?"], convert_to_numpy=True)
+    first_query = time.perf_counter() - query_start
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'ready': None if ready is None else ready - start,
+    'first_query': first_query,
+    'state': faiss_chat_api.warmup['state'],
+    'steps': faiss_chat_api.warmup['steps'],
+    'error': faiss_chat_api.warmup['error'],
+}))
+"""
+
+def run_once(timeout: float, env: dict) -> dict:
+    result = subprocess.run([sys.executable, "-c", CHILD.replace("TIMEOUT", str(timeout))], cwd=ROOT_DIR,
+                            env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if result.returncode != 0 or not lines:
+        raise RuntimeError(result.stderr.strip() or "no output")
+    return json.loads(lines[-1])
+
+def fmt(seconds):
+    return f"{seconds:8.2f}s" if seconds is not None else f"{'-':>9}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure how long faiss_chat_api takes to start serving")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for /ready")
+    parser.add_argument("--offline", action="store_true", help="Block Hugging Face hub access, as without network")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.offline:
+        env.update(HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+    print(f"{'run':>4} {'import':>9} {'create_app':>11} {'ready':>9} {'1st query':>10}  warm-up steps")
+    for run in range(1, args.runs + 1):
+        try:
+            timings = run_once(args.timeout, env)
+        except RuntimeError as e:
+            print(f"{run:>4} failed: {e}")
+            continue
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings['steps'].items())
+        print(f"{run:>4} {fmt(timings['import'])} {fmt(timings['create_app']):>11} {fmt(timings['ready'])} "
+              f"{fmt(timings['first_query']):>10}  {steps}")
+        if timings['state'] != 'ready':
+            print(f"     warm-up {timings['state']}: {timings['error'] or 'timed out'}")
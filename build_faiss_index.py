@@ -1,19 +1,21 @@
-import json
 import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+from embedding_service import get_encoder
+from faiss_store import PageIndex, INDEX_FILE
+from update_faiss_index import summary_pages, index_lock
+from config import FAISS_INDEX_TYPE, FAISS_COMBINED_INDEX, OUTPUT_ANALYSIS_DIR, FAISS_INDEX_DIR
 import glob
 import os
 import sys
 
 # Print the command-line arguments for debugging
 print(f"Command-line arguments: {sys.argv}")
+print(f"Index type: {FAISS_INDEX_TYPE}")  # Set FAISS_INDEX_TYPE=sq8 or pq for compressed indexes
 
-output_analysis_dir = r"c:\Users\chiky\irworkspace\ai_ir\output_analysis"
-faiss_index_dir = r"c:\Users\chiky\irworkspace\ai_ir\faiss_index"
+output_analysis_dir = OUTPUT_ANALYSIS_DIR
+faiss_index_dir = FAISS_INDEX_DIR
 if not os.path.exists(faiss_index_dir):
     os.makedirs(faiss_index_dir)
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = get_encoder()  # Shared embedding server if running, else a local model
 
 # Dynamically detect all report type folders
 report_types = [d for d in os.listdir(output_analysis_dir) if os.path.isdir(os.path.join(output_analysis_dir, d))]
@@ -49,10 +51,6 @@ else:
 
 for report_type in report_types:
     report_dir = os.path.join(output_analysis_dir, report_type)
-    if clients:  # If specific clients were provided
-        folders = [c for c in clients if os.path.isdir(os.path.join(report_dir, c))]
-    else:  # If no clients specified, process all
-        folders = [folder for folder in os.listdir(report_dir) if os.path.isdir(os.path.join(report_dir, folder))]
     print(f"Processing client folder: {report_type}")  # Debugging statement
     if clients:
         folders = [c for c in clients if os.path.isdir(os.path.join(report_dir, c))]
@@ -66,76 +64,31 @@ for report_type in report_types:
             continue  # Skip any client that is not specified in the argument
         folder_path = os.path.join(report_dir, folder)
         years = [y for y in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, y))]
-        
-        # First collect all pages across years
+
+        # Yearly indexes first; the combined index reuses their pages and embeddings
         all_pages = []
+        all_embeddings = []
         for year in years:
             year_path = os.path.join(folder_path, year)
             summary_files = glob.glob(os.path.join(year_path, "**", "pdf_analysis_summary.json"), recursive=True)
-            if not summary_files:
-                continue
-
             pages = []
             for file in summary_files:
-                with open(file, "r", encoding="utf-8") as f:
-                    year_pages = json.load(f)
-                    # Add year info to each page
-                    for page in year_pages:
-                        page['year'] = year
-                    pages.extend(year_pages)
-                    all_pages.extend(year_pages)
-
+                # Each report folder holds one summary; its name is the report part of the page IDs
+                pages.extend(summary_pages(file, year, os.path.basename(os.path.dirname(file))))
             if not pages:
                 continue
 
-            # Create yearly index
-            texts = [page["text"] for page in pages]
-            embeddings = model.encode(texts, convert_to_numpy=True)
-            dimension = embeddings.shape[1]
-            index = faiss.IndexFlatL2(dimension)
-            index.add(embeddings)
-
-            group_faiss_dir = os.path.join(faiss_index_dir, report_type, folder, year)
-            if not os.path.exists(group_faiss_dir):
-                os.makedirs(group_faiss_dir)
-
-            index_path = os.path.join(group_faiss_dir, "faiss_pages.index")
-            summary_path = os.path.join(group_faiss_dir, "pdf_analysis_summary.json")
-            faiss.write_index(index, index_path)
-            with open(summary_path, "w", encoding="utf-8") as f:
-                json.dump(pages, f)
-
+            embeddings = model.encode([page["text"] for page in pages], convert_to_numpy=True)
+            index_path = os.path.join(faiss_index_dir, report_type, folder, year, INDEX_FILE)
+            with index_lock(index_path):  # Don't interleave with an upload updating the same index
+                PageIndex.build(pages, embeddings).save(index_path)
+            all_pages.extend(pages)
+            all_embeddings.append(embeddings)
             print(f"Indexed {len(pages)} pages for '{report_type}/{folder}/{year}' -> {index_path}")
 
-        # Create combined index after yearly indices
-        all_pages = []
-        for year in years:
-            year_path = os.path.join(folder_path, year)
-            summary_files = glob.glob(os.path.join(year_path, "**", "pdf_analysis_summary.json"), recursive=True)
-            if not summary_files:
-                continue
-
-            pages = []
-            for file in summary_files:
-                with open(file, "r", encoding="utf-8") as f:
-                    year_pages = json.load(f)
-                    # Add year info to each page
-                    for page in year_pages:
-                        page['year'] = year
-                    pages.extend(year_pages)
-                    all_pages.extend(pages)
-
-            if all_pages:
-                # Create combined index
-                texts = [p["text"] for p in all_pages]
-                embeddings = model.encode(texts, convert_to_numpy=True)
-                index = faiss.IndexFlatL2(embeddings.shape[1])
-                index.add(embeddings)
-                
-                combined_dir = os.path.join(faiss_index_dir, report_type, folder, "combined")
-                os.makedirs(combined_dir, exist_ok=True)
-                
-                faiss.write_index(index, os.path.join(combined_dir, "faiss_pages.index"))
-                with open(os.path.join(combined_dir, "pages_meta.json"), "w") as f:
-                    json.dump([{"text": p["text"], "page": p["page"], "year": year} 
-                              for p in all_pages], f)
\ No newline at end of file
+        # Multi-year searches fan out over the yearly indexes; the combined one is optional
+        if all_pages and FAISS_COMBINED_INDEX:
+            index_path = os.path.join(faiss_index_dir, report_type, folder, "combined", INDEX_FILE)
+            with index_lock(index_path):
+                PageIndex.build(all_pages, np.concatenate(all_embeddings)).save(index_path)
+            print(f"Indexed {len(all_pages)} pages for '{report_type}/{folder}/combined' -> {index_path}")
@@ -8,6 +8,32 @@ load_dotenv()
 API_URL = "https://dashscope-intl.aliyuncs.com/compatible-mode/v1/chat/completions"
 API_KEY = os.getenv('QWEN_API_KEY')  # Get API key from environment
 MODEL_NAME = "qwen-vl-max"
+MAX_CONCURRENT_REQUESTS = int(os.getenv('QWEN_MAX_CONCURRENT_REQUESTS', 3))  # Safe number of concurrent API calls, shared by all backend processes
+
+# Sentence embeddings for the FAISS indexes, served by embedding_service.py
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # 'torch' (fp32 SentenceTransformer) or 'onnx' (int8 ONNX Runtime)
+EMBEDDING_MODEL_PATH = os.getenv('EMBEDDING_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'all-MiniLM-L6-v2'))  # Local bundle; no hub access when present
+EMBEDDING_ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'all-MiniLM-L6-v2-onnx'))
+EMBEDDING_SERVER_URL = os.getenv('EMBEDDING_SERVER_URL', 'http://127.0.0.1:5100')  # Empty to always embed in-process
+EMBEDDING_THREADS = int(os.getenv('EMBEDDING_THREADS', os.cpu_count() or 1))  # Torch intra-op threads of the server
+EMBEDDING_MAX_BATCH = int(os.getenv('EMBEDDING_MAX_BATCH', 64))  # Texts per forward pass
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_WAIT_MS', 5))  # How long a batch waits for more callers
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 20000))  # Cached embeddings, by text
+
+# FAISS page indexes, see faiss_store.py
+OUTPUT_ANALYSIS_DIR = os.getenv('OUTPUT_ANALYSIS_DIR', r"c:\Users\chiky\irworkspace\ai_ir\output_analysis")  # <client>/<category>/<year>/<report>/
+FAISS_INDEX_DIR = os.getenv('FAISS_INDEX_DIR', r"c:\Users\chiky\irworkspace\ai_ir\faiss_index")  # <client>/<category>/<year|combined>/
+FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'flat')  # 'flat' (float32), 'sq8' (1 byte/dim) or 'pq' (FAISS_PQ_M bytes/vector)
+FAISS_PQ_M = int(os.getenv('FAISS_PQ_M', 48))  # PQ sub-quantizers; 48 codes of 8 bits for 384 dims
+FAISS_RERANK_FACTOR = int(os.getenv('FAISS_RERANK_FACTOR', 4))  # Compressed candidates per result, re-ranked on float16 vectors
+FAISS_COMBINED_INDEX = os.getenv('FAISS_COMBINED_INDEX', 'true').lower() == 'true'  # Also build <client>/<category>/combined; false to only fan out over years
+FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', min(8, os.cpu_count() or 1)))  # Yearly indexes searched at once
+HIERARCHICAL_SEARCH = os.getenv('HIERARCHICAL_SEARCH', 'true').lower() == 'true'  # Report -> section -> page -> passage
+HIERARCHY_MIN_PAGES = int(os.getenv('HIERARCHY_MIN_PAGES', 2000))  # Smaller indexes are searched flat
+HIERARCHY_SECTION_PAGES = int(os.getenv('HIERARCHY_SECTION_PAGES', 10))  # Consecutive pages summarized per section
+HIERARCHY_REPORTS = int(os.getenv('HIERARCHY_REPORTS', 8))  # Reports whose sections are scored
+HIERARCHY_SECTIONS = int(os.getenv('HIERARCHY_SECTIONS', 12))  # Sections whose pages are scored, at least
 
 # Move these constants and function before the route definitions
 QWEN_PROMPT = """
@@ -0,0 +1,135 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+try:
+    from watchdog.observers import Observer  # Optional: invalidate on filesystem changes
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+from config import OUTPUT_ANALYSIS_DIR, FAISS_INDEX_DIR
+
+# What the chat UI's dropdowns list, kept in memory instead of listing directories per request:
+#   clients and categories    folders of FAISS_INDEX_DIR/<client>/<category>/
+#   index years               yearly index folders under a client/category (everything but 'combined')
+#   years                     years of the summaries under OUTPUT_ANALYSIS_DIR/<client>/<category>/
+# Each entry is read from disk on first use and dropped when an index is published, when watchdog
+# reports a change under its directory, or (without watchdog) after CATALOG_TTL seconds.
+CATALOG_TTL = float(os.getenv('DIRECTORY_CATALOG_TTL', 30))
+SUMMARY_JSON = "pdf_analysis_summary.json"
+
+def _subdirectories(path: str) -> list:
+    try:
+        return sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+    except OSError:
+        return []
+
+def _summary_years(base_path: str) -> list:
+    years = set()
+    for root, dirs, files in os.walk(base_path):
+        if SUMMARY_JSON in files:
+            # Only the part below client/category, so digits in the base path can't match
+            year_match = re.search(r'(\d{4})', os.path.relpath(root, base_path))
+            if year_match:
+                years.add(year_match.group(1))
+    return sorted(years, reverse=True)
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, catalog, root: str):
+        self.catalog = catalog
+        self.root = root
+
+    def on_any_event(self, event):
+        for path in (getattr(event, 'src_path', None), getattr(event, 'dest_path', None)):
+            if path:
+                self.catalog.invalidate_path(self.root, path)
+
+class DirectoryCatalog:
+    """Memoized directory listings, each with a content ETag"""
+
+    def __init__(self, index_dir: str = FAISS_INDEX_DIR, analysis_dir: str = OUTPUT_ANALYSIS_DIR):
+        self.index_dir = index_dir
+        self.analysis_dir = analysis_dir
+        self.entries = {}  # key -> (loaded at, value, body, etag)
+        self.lock = threading.Lock()
+        self.observers = []
+        self.watched = set()  # Roots whose entries only change through invalidation
+        self.generation = 0  # Bumped by invalidate(), so a listing read during a change isn't kept
+
+    def _get(self, key: tuple, load, root: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (root in self.watched or time.monotonic() - entry[0] < CATALOG_TTL):
+                return entry
+            generation = self.generation
+        value = load()
+        body = json.dumps(value).encode('utf-8')
+        entry = (time.monotonic(), value, body, hashlib.sha1(body).hexdigest())
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = entry
+        return entry
+
+    def clients(self):
+        """(clients, JSON body, ETag)"""
+        _, value, body, etag = self._get(('clients',), lambda: _subdirectories(self.index_dir), self.index_dir)
+        return value, body, etag
+
+    def categories(self, client: str):
+        _, value, body, etag = self._get(('categories', client),
+                                         lambda: _subdirectories(os.path.join(self.index_dir, client)), self.index_dir)
+        return value, body, etag
+
+    def index_years(self, client: str, category: str) -> list:
+        """Yearly index folders of a client/category"""
+        load = lambda: [d for d in _subdirectories(os.path.join(self.index_dir, client, category)) if d != 'combined']
+        return self._get(('index_years', client, category), load, self.index_dir)[1]
+
+    def years(self, client: str, category: str):
+        _, value, body, etag = self._get(('years', client, category),
+                                         lambda: _summary_years(os.path.join(self.analysis_dir, client, category)),
+                                         self.analysis_dir)
+        return value, body, etag
+
+    def invalidate(self, client: str = None, category: str = None):
+        """Drop cached listings of a client/category (and the client list), or everything"""
+        with self.lock:
+            self.generation += 1
+            if client is None:
+                self.entries.clear()
+                return
+            for key in list(self.entries):
+                if key == ('clients',) or key == ('categories', client) or \
+                        (len(key) == 3 and key[1] == client and (category is None or key[2] == category)):
+                    del self.entries[key]
+
+    def invalidate_path(self, root: str, path: str):
+        """Invalidate what a change at path (under the watched root) can affect"""
+        parts = os.path.relpath(path, root).split(os.sep)
+        if parts[0] in ('.', '..'):
+            self.invalidate()
+        else:
+            self.invalidate(parts[0], parts[1] if len(parts) > 2 else None)
+
+    def start_watching(self) -> bool:
+        """Invalidate from filesystem events instead of the TTL; False if watchdog is unavailable"""
+        if Observer is None or self.observers:
+            return bool(self.observers)
+        for root in (self.index_dir, self.analysis_dir):
+            if not os.path.isdir(root):
+                continue
+            try:
+                observer = Observer()
+                observer.daemon = True
+                observer.schedule(_ChangeHandler(self, root), path=root, recursive=True)
+                observer.start()
+            except OSError as e:
+                print(f"Not watching {root} for catalog changes: {str(e)}")
+                continue
+            self.observers.append(observer)
+            self.watched.add(root)
+        self.invalidate()
+        return bool(self.observers)
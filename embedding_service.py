@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import queue
+import base64
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import requests
+from config import (EMBEDDING_MODEL_NAME, EMBEDDING_MODEL_PATH, EMBEDDING_BACKEND, EMBEDDING_SERVER_URL,
+                    EMBEDDING_THREADS, EMBEDDING_MAX_BATCH, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_CACHE_SIZE)
+
+# One warm embedding model for every process on the machine. The server coalesces concurrent
+# requests into shared forward passes and caches results by text; clients fall back to a local
+# model when the server isn't running, so scripts keep working on their own.
+CLIENT_CHUNK = 256  # Texts per HTTP request from a client
+DEFAULT_PORT = 5100
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+def load_local_model(threads: int = None, backend: str = EMBEDDING_BACKEND):
+    """In-process encoder for the configured backend; torch or onnxruntime is imported only here"""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    if backend == "onnx":
+        from onnx_embedding import OnnxEncoder
+        return OnnxEncoder(threads=threads)
+    bundled = os.path.isdir(EMBEDDING_MODEL_PATH)
+    if bundled:
+        # Everything is on disk; don't let huggingface_hub check for updates (slow, fails offline)
+        os.environ.setdefault('HF_HUB_OFFLINE', '1')
+        os.environ.setdefault('TRANSFORMERS_OFFLINE', '1')
+    else:
+        print(f"No model bundle at {EMBEDDING_MODEL_PATH}; downloading {EMBEDDING_MODEL_NAME} from the hub "
+              f"(create the bundle with 'python embedding_service.py --save-bundle')")
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(EMBEDDING_MODEL_PATH if bundled else EMBEDDING_MODEL_NAME)
+
+def save_model_bundle(path: str = EMBEDDING_MODEL_PATH):
+    """Download the model once and save it where load_local_model looks first"""
+    from sentence_transformers import SentenceTransformer
+    SentenceTransformer(EMBEDDING_MODEL_NAME).save(path)
+    print(f"Saved {EMBEDDING_MODEL_NAME} to {path}")
+
+def encode_array(embeddings: np.ndarray) -> dict:
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return {'shape': list(embeddings.shape), 'data': base64.b64encode(embeddings.tobytes()).decode('ascii')}
+
+def decode_array(payload: dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(payload['data']), dtype=np.float32).reshape(payload['shape'])
+
+class EmbeddingCache:
+    """LRU of embeddings keyed by a hash of the text"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def get(self, text: str):
+        key = self.key(text)
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return vector
+
+    def put(self, text: str, vector: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[self.key(text)] = vector
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class MicroBatcher:
+    """Collects encode requests from many threads and runs them through the model together.
+
+    A batch closes when it holds max_batch texts or wait_ms after its first request arrived,
+    so a lone caller pays at most wait_ms of extra latency while concurrent callers share passes.
+    """
+
+    def __init__(self, model, max_batch: int = EMBEDDING_MAX_BATCH, wait_ms: float = EMBEDDING_BATCH_WAIT_MS,
+                 cache: EmbeddingCache = None):
+        self.model = model
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self.cache = cache or EmbeddingCache(EMBEDDING_CACHE_SIZE)
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.encoded = 0
+        threading.Thread(target=self._run, name='embedding-batcher', daemon=True).start()
+
+    def encode(self, texts: list) -> np.ndarray:
+        future = Future()
+        self.requests.put((texts, future))
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self.requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                vectors = {}
+                missing = []
+                for texts, _ in batch:
+                    for text in texts:
+                        if text in vectors:
+                            continue
+                        cached = self.cache.get(text)
+                        if cached is None:
+                            vectors[text] = None
+                            missing.append(text)
+                        else:
+                            vectors[text] = cached
+                if missing:
+                    embeddings = self.model.encode(missing, batch_size=self.max_batch, convert_to_numpy=True)
+                    for text, vector in zip(missing, embeddings):
+                        vector = vector.astype(np.float32)
+                        vectors[text] = vector
+                        self.cache.put(text, vector)
+                    self.batches += 1
+                    self.encoded += len(missing)
+                for texts, future in batch:
+                    future.set_result(np.stack([vectors[text] for text in texts]) if texts
+                                      else np.zeros((0, 0), dtype=np.float32))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+class EmbeddingClient:
+    """Drop-in for SentenceTransformer.encode that asks the shared embedding server"""
+
+    def __init__(self, url: str = EMBEDDING_SERVER_URL, timeout: float = 120):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self) -> requests.Session:
+        # A forked worker must not reuse the parent's pooled keep-alive sockets: processes sharing
+        # one TCP stream would read each other's responses. Each process gets its own session.
+        if self._session_pid != os.getpid():
+            self._session = requests.Session()
+            self._session_pid = os.getpid()
+        return self._session
+
+    def is_available(self) -> bool:
+        try:
+            return self.session.get(f"{self.url}/health", timeout=2).ok
+        except requests.RequestException:
+            return False
+
+    def encode(self, sentences, batch_size: int = None, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        parts = []
+        for start in range(0, len(texts), CLIENT_CHUNK):
+            response = self.session.post(f"{self.url}/embed", json={'texts': texts[start:start + CLIENT_CHUNK]},
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            parts.append(decode_array(response.json()))
+        if not parts:
+            return np.zeros((0, 0), dtype=np.float32)
+        embeddings = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        return embeddings[0] if single else embeddings
+
+def get_encoder():
+    """Client for the shared embedding server when it is running, otherwise a model in this process"""
+    if EMBEDDING_SERVER_URL:
+        client = EmbeddingClient(EMBEDDING_SERVER_URL)
+        if client.is_available():
+            print(f"Using embedding server at {EMBEDDING_SERVER_URL}")
+            return client
+        print(f"Embedding server at {EMBEDDING_SERVER_URL} is not reachable; loading {EMBEDDING_MODEL_NAME} "
+              f"({EMBEDDING_BACKEND}) in this process")
+    return load_local_model()
+
+def create_server(threads: int = EMBEDDING_THREADS, max_batch: int = EMBEDDING_MAX_BATCH,
+                  wait_ms: float = EMBEDDING_BATCH_WAIT_MS, cache_size: int = EMBEDDING_CACHE_SIZE):
+    from flask import Flask, request, jsonify
+
+    batcher = MicroBatcher(load_local_model(threads), max_batch, wait_ms, EmbeddingCache(cache_size))
+    server = Flask(__name__)
+
+    @server.route('/embed', methods=['POST'])
+    def embed():
+        texts = (request.get_json(silent=True) or {}).get('texts')
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return jsonify({"error": "Expected {\"texts\": [string, ...]}"}), 400
+        return jsonify(encode_array(batcher.encode(texts)))
+
+    @server.route('/health')
+    def health():
+        cache = batcher.cache
+        return jsonify({
+            'model': EMBEDDING_MODEL_NAME,
+            'backend': EMBEDDING_BACKEND,
+            'threads': threads,
+            'max_batch': max_batch,
+            'queued': batcher.requests.qsize(),
+            'batches': batcher.batches,
+            'encoded': batcher.encoded,
+            'cache': {'entries': len(cache.entries), 'hits': cache.hits, 'misses': cache.misses}
+        })
+
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shared sentence embedding server with request micro-batching')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=EMBEDDING_THREADS, help='Torch threads for the forward pass')
+    parser.add_argument('--max-batch', type=int, default=EMBEDDING_MAX_BATCH)
+    parser.add_argument('--wait-ms', type=float, default=EMBEDDING_BATCH_WAIT_MS)
+    parser.add_argument('--cache-size', type=int, default=EMBEDDING_CACHE_SIZE)
+    parser.add_argument('--save-bundle', action='store_true', help=f'Save the model to {EMBEDDING_MODEL_PATH} and exit')
+    args = parser.parse_args()
+    if args.save_bundle:
+        save_model_bundle()
+        sys.exit(0)
+
+    server = create_server(args.threads, args.max_batch, args.wait_ms, args.cache_size)
+    print(f"Embedding server for {EMBEDDING_MODEL_NAME} ({EMBEDDING_BACKEND}) on http://{args.host}:{args.port} "
+          f"({args.threads} threads, batches of up to {args.max_batch})")
+    try:
+        from waitress import serve
+        serve(server, host=args.host, port=args.port, threads=16)
+    except ImportError:
+        server.run(host=args.host, port=args.port, threaded=True)
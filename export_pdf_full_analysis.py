@@ -1,55 +1,407 @@
 import pdfplumber
 import os
+import re
 import json
 import csv
 import glob
 import sys
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import fitz  # PyMuPDF, used by the "pymupdf" and "hybrid" backends
+except ImportError:
+    fitz = None
+
+# Text extraction backends:
+#   pdfplumber - text, tables and images through pdfplumber (pure Python, slowest)
+#   pymupdf    - text and images through PyMuPDF, no table extraction
+#   hybrid     - PyMuPDF for text and images, pdfplumber tables only on table-like pages. Those
+#                tables are extracted during the export even when artifacts are lazy; without
+#                that, hybrid would be the same as pymupdf.
+EXTRACTION_BACKENDS = ("pdfplumber", "pymupdf", "hybrid")
+# pdfplumber stays the default until a retrieval benchmark shows the faster backends match it;
+# opt in with PDF_EXPORT_BACKEND=hybrid or pymupdf
+DEFAULT_BACKEND = os.environ.get("PDF_EXPORT_BACKEND", "pdfplumber")
+
+# Table detection heuristics for the hybrid backend
+TABLE_RULE_THRESHOLD = 6  # Straight horizontal/vertical rules or cell rectangles on the page
+TABLE_NUMERIC_ROW_THRESHOLD = 4  # Text lines carrying two or more numeric cells
+NUMERIC_CELL = re.compile(r"\(?-?[\d,]+(?:\.\d+)?\)?%?")
+
+# Export outputs: page records are appended to the JSONL as each page finishes, the checkpoint
+# records progress for resuming, and the summary JSON is assembled once the export is complete
+PAGES_JSONL = "pdf_analysis_pages.jsonl"
+CHECKPOINT_JSON = "pdf_analysis_checkpoint.json"
+SUMMARY_JSON = "pdf_analysis_summary.json"
+POOL_SHARD_PAGES = 8  # Pages per process-pool task
+
+# Page images and table CSVs are produced on first request unless eager_artifacts is set
+DEFAULT_IMAGE_RESOLUTION = 200
+MIN_IMAGE_RESOLUTION = 36
+MAX_IMAGE_RESOLUTION = 600
+
+def write_tables(tables, i, output_folder):
+    """Write extracted tables to CSV files and return their paths"""
+    table_paths = []
+    for t_idx, table in enumerate(tables, start=1):
+        table_path = os.path.join(output_folder, f"page_{i}_table_{t_idx}.csv")
+        with open(table_path, "w", newline='', encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for row in table:
+                writer.writerow(row)
+        table_paths.append(table_path)
+    return table_paths
+
+def page_image_path(output_folder, i, resolution=DEFAULT_IMAGE_RESOLUTION):
+    """Cache location of the full-page PNG for page i at the given resolution"""
+    if resolution == DEFAULT_IMAGE_RESOLUTION:
+        return os.path.join(output_folder, f"page_{i}_full.png")  # Name used by eager exports
+    return os.path.join(output_folder, f"page_{i}_full_{resolution}dpi.png")
+
+def render_page_image(pdf_path, output_folder, i, resolution=DEFAULT_IMAGE_RESOLUTION):
+    """Return the full-page PNG for page i, rendering and caching it on first request"""
+    resolution = max(MIN_IMAGE_RESOLUTION, min(int(resolution), MAX_IMAGE_RESOLUTION))
+    img_path = page_image_path(output_folder, i, resolution)
+    if os.path.exists(img_path):
+        return img_path
+
+    # Render to a temp file and rename so concurrent requests never see a partial PNG
+    os.makedirs(output_folder, exist_ok=True)
+    tmp_path = f"{img_path}.{os.getpid()}.tmp"
+    if fitz is not None:
+        doc = fitz.open(pdf_path)
+        try:
+            doc.load_page(i - 1).get_pixmap(dpi=resolution).save(tmp_path, output="png")
+        finally:
+            doc.close()
+    else:
+        with pdfplumber.open(pdf_path) as pdf:
+            pdf.pages[i - 1].to_image(resolution=resolution).save(tmp_path, format="PNG")
+    os.replace(tmp_path, img_path)
+    return img_path
+
+def export_page_tables(pdf_path, output_folder, i):
+    """Return the CSV paths for page i's tables, extracting them with pdfplumber on first request"""
+    # The index file also caches pages with no tables, so they are only scanned once
+    index_path = os.path.join(output_folder, f"page_{i}_tables.json")
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    os.makedirs(output_folder, exist_ok=True)
+    with pdfplumber.open(pdf_path) as pdf:
+        table_paths = write_tables(pdf.pages[i - 1].extract_tables(), i, output_folder)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table_paths, f)
+    os.replace(tmp_path, index_path)
+    return table_paths
+
+def get_page_images(page_info, resolution=DEFAULT_IMAGE_RESOLUTION):
+    """Image paths for a summary page record, rendering lazily when the export skipped images"""
+    if resolution == DEFAULT_IMAGE_RESOLUTION:
+        existing = [p for p in page_info.get("images", []) if os.path.exists(p)]
+        if existing:
+            return existing
+    if page_info.get("pdf_path") and page_info.get("artifact_dir") and os.path.exists(page_info["pdf_path"]):
+        return [render_page_image(page_info["pdf_path"], page_info["artifact_dir"], page_info["page"], resolution)]
+    return []
+
+def get_page_tables(page_info):
+    """Table CSV paths for a summary page record, extracting lazily when the export skipped tables"""
+    if page_info.get("tables"):
+        return page_info["tables"]
+    if page_info.get("pdf_path") and page_info.get("artifact_dir") and os.path.exists(page_info["pdf_path"]):
+        return export_page_tables(page_info["pdf_path"], page_info["artifact_dir"], page_info["page"])
+    return []
+
+def new_page_info(i, pdf_path, output_folder):
+    # pdf_path and artifact_dir let readers render images and tables on demand
+    return {"page": i, "text": "", "tables": [], "images": [],
+            "pdf_path": pdf_path, "artifact_dir": output_folder}
+
+def analyze_page(page, i, output_folder, pdf_path=None, eager_artifacts=False):
+    """Extract text (and optionally tables and a full-page image) for a single pdfplumber page"""
+    page_info = new_page_info(i, pdf_path, output_folder)
+
+    # Extract text
+    text = page.extract_text() or ""
+    page_info["text"] = text.strip()
+
+    if not eager_artifacts:
+        return page_info
+
+    # Extract tables
+    page_info["tables"] = write_tables(page.extract_tables(), i, output_folder)
+
+    # --- Export full page as image only ---
+    try:
+        full_img_path = page_image_path(output_folder, i)
+        page.to_image(resolution=DEFAULT_IMAGE_RESOLUTION).save(full_img_path, format="PNG")
+        page_info["images"].append(full_img_path)
+    except Exception as e:
+        print(f"Failed to export full page image on page {i}: {e}")
+
+    return page_info
+
+def looks_like_table(fitz_page, text):
+    """Cheap check for whether a PyMuPDF page is worth running pdfplumber's table finder on"""
+    # Ruled tables: count straight rules and rectangles among the vector drawings
+    rules = 0
+    for drawing in fitz_page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "re":
+                rules += 1
+            elif item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.x - p2.x) < 1 or abs(p1.y - p2.y) < 1:
+                    rules += 1
+        if rules >= TABLE_RULE_THRESHOLD:
+            return True
+
+    # Unruled financial tables: several lines with multiple numeric cells
+    numeric_rows = sum(1 for line in text.splitlines() if len(NUMERIC_CELL.findall(line)) >= 2)
+    return numeric_rows >= TABLE_NUMERIC_ROW_THRESHOLD
+
+def analyze_page_fitz(fitz_page, i, output_folder, plumber_pdf=None, pdf_path=None, eager_artifacts=False):
+    """Extract text with PyMuPDF, tables of table-like pages when given plumber_pdf (the hybrid
+    backend), and with eager_artifacts a full-page image"""
+    page_info = new_page_info(i, pdf_path, output_folder)
+
+    # Extract text in reading order, which keeps it close to pdfplumber's output
+    text = fitz_page.get_text("text", sort=True) or ""
+    page_info["text"] = text.strip()
+
+    # Extract tables only on pages that look like they contain one
+    if plumber_pdf is not None and looks_like_table(fitz_page, page_info["text"]):
+        plumber_page = plumber_pdf.pages[i - 1]
+        page_info["tables"] = write_tables(plumber_page.extract_tables(), i, output_folder)
+        plumber_page.flush_cache()
+
+    if not eager_artifacts:
+        return page_info
+
+    # --- Export full page as image only ---
+    try:
+        full_img_path = page_image_path(output_folder, i)
+        fitz_page.get_pixmap(dpi=DEFAULT_IMAGE_RESOLUTION).save(full_img_path)
+        page_info["images"].append(full_img_path)
+    except Exception as e:
+        print(f"Failed to export full page image on page {i}: {e}")
+
+    return page_info
+
+def iter_page_range(pdf_path, output_folder, first_page, last_page, backend="pdfplumber", eager_artifacts=False):
+    """Yield page records for pages first_page..last_page (1-based, inclusive) one at a time"""
+    if backend == "pdfplumber":
+        with pdfplumber.open(pdf_path) as pdf:
+            for i in range(first_page, last_page + 1):
+                page = pdf.pages[i - 1]
+                yield analyze_page(page, i, output_folder, pdf_path, eager_artifacts)
+                page.flush_cache()  # Drop parsed layout objects once the page is done
+        return
+
+    # The hybrid backend extracts the tables of table-like pages up front, lazy artifacts or not
+    plumber_pdf = pdfplumber.open(pdf_path) if backend == "hybrid" else None
+    doc = fitz.open(pdf_path)
+    try:
+        for i in range(first_page, last_page + 1):
+            yield analyze_page_fitz(doc.load_page(i - 1), i, output_folder, plumber_pdf, pdf_path, eager_artifacts)
+    finally:
+        doc.close()
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+
+def export_page_range(pdf_path, output_folder, first_page, last_page, backend="pdfplumber", eager_artifacts=False):
+    """Worker entry point: analyze pages first_page..last_page (1-based, inclusive)"""
+    return list(iter_page_range(pdf_path, output_folder, first_page, last_page, backend, eager_artifacts))
+
+def shard_pages(first_page, last_page, shard_size=POOL_SHARD_PAGES):
+    """Split first_page..last_page into contiguous ranges of at most shard_size pages"""
+    return [(start, min(start + shard_size - 1, last_page))
+            for start in range(first_page, last_page + 1, shard_size)]
+
+def iter_page_results(pdf_path, output_folder, first_page, last_page, backend, eager_artifacts, workers):
+    """Yield lists of page records in page order, serially or from a process pool"""
+    if not workers or workers <= 1 or last_page - first_page < 1:
+        for page_info in iter_page_range(pdf_path, output_folder, first_page, last_page, backend, eager_artifacts):
+            yield [page_info]
+        return
+
+    # Process-pool mode: each worker opens its own handle and analyzes a small page range.
+    # Only a bounded window of shards is in flight, so finished-but-unwritten pages stay few.
+    shards = iter(shard_pages(first_page, last_page))
+    print(f"Analyzing pages {first_page}-{last_page} with {workers} workers ({backend})")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(shard):
+            return executor.submit(export_page_range, pdf_path, output_folder, shard[0], shard[1],
+                                   backend, eager_artifacts)
+
+        pending = deque(submit(shard) for shard in itertools.islice(shards, workers * 2))
+        while pending:
+            # Waiting on the oldest shard first keeps the output in page order
+            records = pending.popleft().result()
+            next_shard = next(shards, None)
+            if next_shard:
+                pending.append(submit(next_shard))
+            yield records
+
+def pdf_fingerprint(pdf_path, backend):
+    """Identify the source PDF and backend so a checkpoint is never resumed against a changed file"""
+    stat = os.stat(pdf_path)
+    return {"pdf_path": os.path.abspath(pdf_path), "pdf_size": stat.st_size,
+            "pdf_mtime": int(stat.st_mtime), "backend": backend}
+
+def load_checkpoint(output_folder):
+    checkpoint_path = os.path.join(output_folder, CHECKPOINT_JSON)
+    if not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable checkpoint {checkpoint_path}: {e}")
+        return None
+
+def write_checkpoint(output_folder, checkpoint):
+    checkpoint_path = os.path.join(output_folder, CHECKPOINT_JSON)
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+def resume_point(output_folder, fingerprint):
+    """Return how many leading pages are already in the JSONL, truncating anything after them"""
+    jsonl_path = os.path.join(output_folder, PAGES_JSONL)
+    checkpoint = load_checkpoint(output_folder)
+    if not os.path.exists(jsonl_path):
+        return 0
+    if not checkpoint or any(checkpoint.get(k) != v for k, v in fingerprint.items()):
+        print("Source PDF or backend changed since the last export, starting from page 1")
+        os.remove(jsonl_path)
+        return 0
+
+    # Keep the contiguous run of complete records for pages 1..n; a crash can leave a partial last line
+    valid_bytes = 0
+    expected_page = 1
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if record.get("page") != expected_page:
+                break
+            valid_bytes += len(line)
+            expected_page += 1
+    with open(jsonl_path, "r+b") as f:
+        f.truncate(valid_bytes)
+    return expected_page - 1
+
+def read_page_records(output_folder):
+    """Yield page records of an export, including one that is still running or was interrupted"""
+    jsonl_path = os.path.join(output_folder, PAGES_JSONL)
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # Record still being written
+                yield json.loads(line)
+        return
+    # Exports written before the JSONL format only have the summary
+    summary_path = os.path.join(output_folder, SUMMARY_JSON)
+    if os.path.exists(summary_path):
+        with open(summary_path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+def write_summary(output_folder, last_page=None):
+    """Stream the JSONL page records into pdf_analysis_summary.json without loading them all"""
+    summary_path = os.path.join(output_folder, SUMMARY_JSON)
+    tmp_path = f"{summary_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for n, record in enumerate(read_page_records(output_folder)):
+            if last_page and record["page"] > last_page:
+                break
+            f.write(",\n  " if n else "\n  ")
+            f.write(json.dumps(record, ensure_ascii=False))
+        f.write("\n]")
+    os.replace(tmp_path, summary_path)
+    return summary_path
+
+def export_pdf_for_ai(pdf_path, output_folder, max_pages=None, workers=1, backend=DEFAULT_BACKEND,
+                      eager_artifacts=False):
+    if backend not in EXTRACTION_BACKENDS:
+        raise ValueError(f"Unknown extraction backend '{backend}', expected one of {EXTRACTION_BACKENDS}")
+    if backend != "pdfplumber" and fitz is None:
+        print(f"PyMuPDF is not installed, falling back from '{backend}' to 'pdfplumber'")
+        backend = "pdfplumber"
 
-def export_pdf_for_ai(pdf_path, output_folder, max_pages=None):
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    summary = []
     with pdfplumber.open(pdf_path) as pdf:
         total_pages = len(pdf.pages)
-        last_page = max_pages if max_pages else total_pages
-        for i, page in enumerate(pdf.pages[:last_page], start=1):
-            page_info = {"page": i, "text": "", "tables": [], "images": []}
-
-            # Extract text
-            text = page.extract_text() or ""
-            page_info["text"] = text.strip()
-
-            # Extract tables
-            tables = page.extract_tables()
-            for t_idx, table in enumerate(tables, start=1):
-                table_path = os.path.join(output_folder, f"page_{i}_table_{t_idx}.csv")
-                with open(table_path, "w", newline='', encoding="utf-8") as f:
-                    writer = csv.writer(f)
-                    for row in table:
-                        writer.writerow(row)
-                page_info["tables"].append(table_path)
-
-            # --- Export full page as image only ---
-            try:
-                full_img_path = os.path.join(output_folder, f"page_{i}_full.png")
-                page.to_image(resolution=200).save(full_img_path, format="PNG")
-                page_info["images"].append(full_img_path)
-            except Exception as e:
-                print(f"Failed to export full page image on page {i}: {e}")
+    last_page = min(max_pages, total_pages) if max_pages else total_pages
+
+    fingerprint = pdf_fingerprint(pdf_path, backend)
+    completed = resume_point(output_folder, fingerprint)
+    checkpoint = dict(fingerprint, total_pages=last_page, completed_pages=completed, complete=False)
+    summary_path = os.path.join(output_folder, SUMMARY_JSON)
+    previous = load_checkpoint(output_folder)
+    if (completed >= last_page and previous and previous.get("complete")
+            and previous.get("total_pages") == last_page and os.path.exists(summary_path)):
+        print(f"Export already complete: {summary_path}")
+        return
+    if completed:
+        print(f"Resuming {pdf_path} from page {completed + 1}/{last_page}")
+    write_checkpoint(output_folder, checkpoint)
 
-            summary.append(page_info)
+    # Append each page as soon as it is done; the checkpoint always points at a fully written record
+    jsonl_path = os.path.join(output_folder, PAGES_JSONL)
+    if completed < last_page:
+        with open(jsonl_path, "a", encoding="utf-8") as out:
+            for records in iter_page_results(pdf_path, output_folder, completed + 1, last_page,
+                                             backend, eager_artifacts, workers):
+                for record in records:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                checkpoint["completed_pages"] = records[-1]["page"]
+                write_checkpoint(output_folder, checkpoint)
 
     # Save summary JSON
-    summary_path = os.path.join(output_folder, "pdf_analysis_summary.json")
-    with open(summary_path, "w", encoding="utf-8") as f:
-        json.dump(summary, f, ensure_ascii=False, indent=2)
+    write_summary(output_folder, last_page)
+    checkpoint["complete"] = True
+    write_checkpoint(output_folder, checkpoint)
     print(f"Exported analysis summary to {summary_path}")
 
 if __name__ == "__main__":
     pdfs_base_folder = r"c:\Users\chiky\irworkspace\ai_ir\files"
     output_base_folder = r"c:\Users\chiky\irworkspace\ai_ir\output_analysis"
     max_pages = 500
+    # Worker processes for page extraction; override with --workers N or PDF_EXPORT_WORKERS
+    workers = int(os.environ.get("PDF_EXPORT_WORKERS", os.cpu_count() or 1))
+    if "--workers" in sys.argv:
+        workers_index = sys.argv.index("--workers")
+        try:
+            workers = int(sys.argv[workers_index + 1])
+        except (IndexError, ValueError):
+            print(f"Invalid --workers value, using {workers}")
+        del sys.argv[workers_index:workers_index + 2]
+    # Extraction backend; override with --backend NAME or PDF_EXPORT_BACKEND
+    backend = DEFAULT_BACKEND
+    if "--backend" in sys.argv:
+        backend_index = sys.argv.index("--backend")
+        if backend_index + 1 < len(sys.argv):
+            backend = sys.argv[backend_index + 1]
+        del sys.argv[backend_index:backend_index + 2]
+    # Page images and table CSVs are rendered on demand unless --eager-artifacts is given
+    eager_artifacts = "--eager-artifacts" in sys.argv
+    if eager_artifacts:
+        sys.argv.remove("--eager-artifacts")
 
     # If a specific PDF path is provided, analyze only that PDF
     if len(sys.argv) > 1 and sys.argv[1].lower().endswith('.pdf'):
@@ -64,7 +416,8 @@ if __name__ == "__main__":
         pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
         output_folder = os.path.join(output_base_folder, client, category, year, pdf_name)
         print(f"Processing {pdf_path} -> {output_folder}")
-        export_pdf_for_ai(pdf_path, output_folder, max_pages=max_pages)
+        export_pdf_for_ai(pdf_path, output_folder, max_pages=max_pages, workers=workers,
+                          backend=backend, eager_artifacts=eager_artifacts)
     else:
         # Support optional client or category argument
         if len(sys.argv) > 1:
@@ -87,4 +440,5 @@ if __name__ == "__main__":
                         pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
                         output_folder = os.path.join(output_base_folder, client, category, year, pdf_name)
                         print(f"Processing {pdf_path} -> {output_folder}")
-                        export_pdf_for_ai(pdf_path, output_folder, max_pages=max_pages)
\ No newline at end of file
+                        export_pdf_for_ai(pdf_path, output_folder, max_pages=max_pages, workers=workers,
+                                          backend=backend, eager_artifacts=eager_artifacts)
\ No newline at end of file
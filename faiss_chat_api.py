@@ -1,14 +1,14 @@
 import json
-import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
+import time
 import requests
 import base64
 import os
 import re
 import subprocess  # Add this import
 from flask import Flask, request, jsonify, send_from_directory
-from config import API_URL, API_KEY, MODEL_NAME
+from config import API_URL, API_KEY, MODEL_NAME, OUTPUT_ANALYSIS_DIR, FAISS_INDEX_DIR, HIERARCHICAL_SEARCH
+from embedding_service import get_encoder
+from directory_catalog import DirectoryCatalog
 from flask import Response, stream_with_context
 
 def encode_image_to_base64(image_path):
@@ -94,71 +94,163 @@ def ask_qwen(message_content):
 # texts = [page["text"] for page in pages]
 # page_numbers = [page["page"] for page in pages]
 
-from threading import Lock
+from threading import Lock, Thread
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = None
+model_lock = Lock()
 app = Flask(__name__, static_folder='static')
 index_cache = {}
 pages_cache = {}
 cache_lock = Lock()
 
+# faiss, torch and pdfplumber take seconds to import, so nothing heavy is imported at module level.
+# A background warm-up pays for them (and the first forward pass) while the server already accepts
+# connections; /ready tells load balancers and start scripts when queries will be fast.
+warmup = {'state': 'cold', 'started': None, 'finished': None, 'steps': {}, 'error': None}
+warmup_lock = Lock()
+# Client/category/year listings for the UI and the query router, cached instead of listed per request
+directory_catalog = DirectoryCatalog()
+
+def load_model():
+    """The sentence encoder: the shared embedding server if it is running, else a model in this process"""
+    global model
+    with model_lock:
+        if model is None:
+            model = get_encoder()
+    return model
+
+def _warm_up():
+    steps = (
+        ('import_faiss', lambda: __import__('faiss_store')),
+        ('import_pdf_tools', lambda: __import__('export_pdf_full_analysis')),
+        ('load_model', load_model),
+        ('first_encode', lambda: load_model().encode(["warm-up"], convert_to_numpy=True)),
+        ('watch_directories', directory_catalog.start_watching),
+    )
+    try:
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            warmup['steps'][name] = round(time.perf_counter() - start, 3)
+        warmup['state'] = 'ready'
+    except Exception as e:
+        warmup['state'] = 'failed'
+        warmup['error'] = str(e)
+        print(f"Warm-up failed: {str(e)}")
+    warmup['finished'] = time.time()
+    print(f"Warm-up {warmup['state']} in {warmup['finished'] - warmup['started']:.1f}s {warmup['steps']}")
+
+def start_warmup():
+    """Start the warm-up thread once per process; safe to call again"""
+    with warmup_lock:
+        if warmup['state'] != 'cold':
+            return
+        warmup['state'] = 'warming'
+        warmup['started'] = time.time()
+    Thread(target=_warm_up, name='warm-up', daemon=True).start()
+
+def create_app(preload_model=False, warm_up=True):
+    """WSGI entry point (gunicorn -c gunicorn_chat_config.py, or 'faiss_chat_api:create_app()').
+
+    Returns immediately and warms up in the background by default. With preload_model, the encoder
+    is loaded before returning instead; under gunicorn's preload_app that happens once in the master
+    so workers share the local model's weights copy-on-write, and gunicorn_chat_config.py starts the
+    rest of the warm-up in each worker. Nothing is encoded before the fork: inference would start
+    thread pools the workers can't inherit.
+    """
+    if preload_model:
+        load_model()
+    if warm_up:
+        start_warmup()
+    return app
+
+@app.route('/ready')
+def ready():
+    """200 once the warm-up has finished, 503 while cold, warming or failed"""
+    status = dict(warmup, steps=dict(warmup['steps']))
+    if warmup['started']:
+        status['elapsed'] = round((warmup['finished'] or time.time()) - warmup['started'], 3)
+    return jsonify(status), 200 if warmup['state'] == 'ready' else 503
+
+def cached_page_index(index_path):
+    """PageIndex of a path, loaded once per published version; None without page IDs"""
+    from faiss_store import PageIndex, index_version
+    version = index_version(index_path)
+    if version is None:
+        return None
+    with cache_lock:
+        cached = index_cache.get(index_path)
+        if cached and cached[0] == version:
+            return cached[1]
+        page_index = PageIndex.load(index_path)
+        # Key on the version actually loaded, which is newer if a save published in between
+        index_cache[index_path] = ((page_index and page_index.version) or version, page_index)
+        return page_index
+
+def remember_page_index(index_path, page_index):
+    """Keep serving an index this process just updated and saved, instead of reloading it"""
+    with cache_lock:
+        index_cache[index_path] = (page_index.version, page_index)
+
+def available_years(client, category):
+    """Yearly index folders of a client/category"""
+    return directory_catalog.index_years(client, category)
+
 def load_index_and_pages(client, category, year=None, report=None):
+    """(index, {label: page}) for one year of a client/category, or for its combined index.
+
+    Indexes built with page IDs come back as a PageIndex whose search labels are page IDs.
+    Older positional indexes are read with their summaries; their labels are row numbers.
+    """
+    from faiss_store import INDEX_FILE, index_exists
+    index_path = os.path.join(FAISS_INDEX_DIR, client, category, str(year) if year else "combined", INDEX_FILE)
+    if not index_exists(index_path):
+        print(f"Error: Index file not found at {index_path}")
+        return None, None
+    page_index = cached_page_index(index_path)
+    if page_index is not None:
+        return page_index, page_index.pages
+    return load_positional_index(index_path, client, category, year, report)
+
+def load_positional_index(index_path, client, category, year=None, report=None):
     import glob
     if year:
-        index_path = fr"c:\Users\chiky\irworkspace\ai_ir\faiss_index\{client}\{category}\{year}\faiss_pages.index"
         if report:
-            summary_path = fr"c:\Users\chiky\irworkspace\ai_ir\output_analysis\{client}\{category}\{year}\{report}\pdf_analysis_summary.json"
+            summary_path = os.path.join(OUTPUT_ANALYSIS_DIR, client, category, str(year), report, "pdf_analysis_summary.json")
             if not os.path.exists(summary_path):
                 print(f"Error: Summary file not found at {summary_path}")
                 return None, None
             summary_files = [summary_path]
         else:
-            summary_files = glob.glob(
-                fr"c:\Users\chiky\irworkspace\ai_ir\output_analysis\{client}\{category}\{year}\*\pdf_analysis_summary.json"
-            )
+            summary_files = glob.glob(os.path.join(OUTPUT_ANALYSIS_DIR, client, category, str(year), "*", "pdf_analysis_summary.json"))
             if not summary_files:
                 print(f"Error: No summary files found for {client}/{category}/{year}")
     else:
-        index_path = fr"c:\Users\chiky\irworkspace\ai_ir\faiss_index\{client}\{category}\combined\faiss_pages.index"
-        summary_files = glob.glob(
-            fr"c:\Users\chiky\irworkspace\ai_ir\output_analysis\{client}\{category}\*\*\pdf_analysis_summary.json"
-        )
+        summary_files = glob.glob(os.path.join(OUTPUT_ANALYSIS_DIR, client, category, "*", "*", "pdf_analysis_summary.json"))
         if not summary_files:
             print(f"Error: No summary files found for {client}/{category}")
-
-    if not os.path.exists(index_path):
-        print(f"Error: Index file not found at {index_path}")
+    if not summary_files:
         return None, None
 
-    cache_key = f"{client}|{category}|{year}" if year else f"{client}|{category}|combined"
+    cache_key = f"{index_path}|{report}" if report else index_path
     with cache_lock:
-        if cache_key in index_cache and cache_key in pages_cache:
-            return index_cache[cache_key], pages_cache[cache_key]
-        
-        if not os.path.exists(index_path):
-            return None, None
-            
-        if year and report:
-            if not os.path.exists(summary_path):
-                return None, None
-            summary_files = [summary_path]
-        else:
-            if not summary_files:
-                return None, None
+        if cache_key in pages_cache:
+            return pages_cache[cache_key]
 
-        idx = faiss.read_index(index_path)
+        from faiss_store import read_index
+        idx = read_index(index_path)
         pages = []
         for summary_path in summary_files:
+            # Positional indexes have a row for every page, empty or not; keep them all so rows line up
             with open(summary_path, "r", encoding="utf-8") as f:
-                pages.extend([page for page in json.load(f) if page["text"].strip()])
+                pages.extend(json.load(f))
         
         for page in pages:
             page.setdefault("year", year)
             page.setdefault("filename", os.path.basename(summary_path))
         
-        index_cache[cache_key] = idx
-        pages_cache[cache_key] = pages
-        return idx, pages
+        pages_cache[cache_key] = (idx, dict(enumerate(pages)))
+        return pages_cache[cache_key]
 
 @app.route('/')
 def serve_chat():
@@ -182,7 +274,7 @@ def serve_chat():
 #     texts = [page["text"] for page in pages]
 #     page_numbers = [page["page"] for page in pages]
 
-#     q_emb = model.encode([question], convert_to_numpy=True)
+#     q_emb = load_model().encode([question], convert_to_numpy=True)
 #     D, I = index.search(q_emb, k=10)
 
 #     question_keywords = set(question.lower().split())
@@ -246,10 +338,12 @@ def serve_chat():
 
 @app.route('/chat/stream', methods=['POST'])
 def chat_stream():
+    from export_pdf_full_analysis import get_page_images, DEFAULT_IMAGE_RESOLUTION  # Deferred: pulls in pdfplumber
     data = request.json
     question = data.get('question', '')
     top_k = int(data.get('top_k', 3))
     max_images = int(data.get('max_images', 0))
+    image_resolution = int(data.get('image_resolution', DEFAULT_IMAGE_RESOLUTION))
     client = data.get('client')
     category = data.get('category')
     year = data.get('year')
@@ -258,44 +352,98 @@ def chat_stream():
     if not question or not client or not category:
         return jsonify({"error": "Missing question, client, or category"}), 400
 
-    index, pages = load_index_and_pages(client, category, year)
-    if index is None or pages is None:
-        return jsonify({"error": "Index or summary not found for the specified client/category/year"}), 404
-
-    texts = [page["text"] for page in pages]
-    page_numbers = [page["page"] for page in pages]
-
-    q_emb = model.encode([question], convert_to_numpy=True)
-    D, I = index.search(q_emb, k=100)
+    from fanout_search import fan_out, FUSION_METHODS
+    years = [str(y) for y in data.get('years') or []]  # Several years, searched side by side
+    fusion = data.get('fusion', 'rrf')
+    if fusion not in FUSION_METHODS:
+        return jsonify({"error": f"fusion must be one of {', '.join(FUSION_METHODS)}"}), 400
+
+    # Without explicit years, search the period the question names: one year goes to its own index,
+    # several are fanned out over their yearly indexes, quarters narrow to their reports' page IDs,
+    # and nothing detected searches the combined index (or every yearly index if there is none)
+    from query_router import analyze_query, id_ranges_for
+    scope = analyze_query(question, [year] if year else years or available_years(client, category))
+    routed = not year and not years
+    if routed and len(scope["years"]) > 1:
+        years = scope["years"]
+    index = pages = None
+    if not years:
+        if routed and scope["years"]:
+            index, pages = load_index_and_pages(client, category, scope["years"][0])
+            if index is not None:
+                year = scope["years"][0]
+        if index is None:
+            index, pages = load_index_and_pages(client, category, year)
+        if index is None and not year:
+            years = available_years(client, category)
+
+    from hierarchical_search import search_pages
+    q_emb = load_model().encode([question], convert_to_numpy=True)
+    candidates = None
+    timings = {}
+    id_ranges = None
+    if years:
+        indexes = {}
+        for name in years:
+            year_index, year_pages = load_index_and_pages(client, category, name)
+            if year_index is not None:
+                indexes[name] = (year_index, year_pages)
+        if indexes:
+            id_ranges = {name: id_ranges_for(year_index, [], scope["quarters"])
+                         for name, (year_index, _) in indexes.items() if hasattr(year_index, "reports")}
+            merged, timings = fan_out({name: year_index for name, (year_index, _) in indexes.items()},
+                                      q_emb, 100, fusion, id_ranges)
+            candidates = [indexes[name][1].get(label) for name, label, _ in merged]
+            years = list(indexes)
+        else:
+            print(f"No yearly indexes for {years}; searching the combined index")
+            index, pages = load_index_and_pages(client, category)
+            years = []
+    if candidates is None:
+        if index is None or pages is None:
+            return jsonify({"error": "Index or summary not found for the specified client/category/year"}), 404
+        if hasattr(index, "reports"):
+            id_ranges = id_ranges_for(index, [] if year else scope["years"], scope["quarters"])
+        start = time.perf_counter()
+        D, I = search_pages(index, q_emb, k=100, id_ranges=id_ranges)
+        timings[year or "combined"] = round((time.perf_counter() - start) * 1000, 3)
+        candidates = [pages.get(int(idx)) for idx in I[0]]
+    search_scope = {"year": year, "years": years, "detected_years": scope["years"], "quarters": scope["quarters"],
+                    "fusion": fusion if len(years) > 1 else None, "timings_ms": timings}
+    print(f"Search scope for {question!r}: {search_scope}")
 
     question_keywords = set(question.lower().split())
-    boosted_indices = []
-    other_indices = []
+    boosted_pages = []
+    other_pages = []
     
     # Use the same enhanced filtering as in /chat endpoint
-    for idx in I[0]:
-        if idx >= len(texts):
+    for page_info in candidates:
+        if page_info is None:  # -1 padding, or a page removed since the search
             continue
-        page_text = texts[idx].lower()
+        page_text = page_info["text"].lower()
         text_length = len(page_text.split())
         keyword_matches = sum(1 for kw in question_keywords if kw in page_text)
         
         if (text_length > 10 and keyword_matches >= min(2, len(question_keywords))):
-            boosted_indices.append(idx)
+            boosted_pages.append(page_info)
         else:
-            other_indices.append(idx)
+            other_pages.append(page_info)
             
-    final_indices = (boosted_indices + other_indices)[:top_k]
+    final_pages = (boosted_pages + other_pages)[:top_k]
+    passages = [None] * len(final_pages)
+    if HIERARCHICAL_SEARCH:
+        from hierarchical_search import best_passages
+        passages = best_passages(load_model(), q_emb[0], final_pages)
 
     def generate():
         # First send search results as a special message
         search_results = []
-        for rank, idx in enumerate(final_indices):
-            page_info = pages[idx]
+        for rank, (page_info, passage) in enumerate(zip(final_pages, passages)):
             search_results.append({
                 "rank": rank + 1,
-                "page": page_numbers[idx],
-                "text": texts[idx][:1000],
+                "page": page_info["page"],
+                "text": page_info["text"][:1000],
+                "passage": passage,
                 "client": client,
                 "category": category,
                 "year": page_info.get("year", year),
@@ -307,13 +455,17 @@ def chat_stream():
         grouped_text = ""
         message_content = []
         image_count = 0  # Initialize image count
-        for rank, idx in enumerate(final_indices):
-            page_info = pages[idx]
-            grouped_text += f"\n---\nRank {rank+1}: Page {page_numbers[idx]}\n{texts[idx]}"
+        for rank, page_info in enumerate(final_pages):
+            grouped_text += f"\n---\nRank {rank+1}: Page {page_info['page']}\n{page_info['text']}"
             
-            # Get images from page_info if available
-            if "images" in page_info and isinstance(page_info["images"], list):
-                for img_path in page_info["images"]:
+            # Get images for the page, rendering them on first use if the export skipped them
+            if image_count < max_images:
+                try:
+                    page_images = get_page_images(page_info, image_resolution)
+                except Exception as e:
+                    print(f"Failed to render page image for page {page_info['page']}: {e}")
+                    page_images = []
+                for img_path in page_images:
                     if image_count >= max_images:  # Check if image count has reached top_k
                         break
                     if os.path.exists(img_path):
@@ -338,39 +490,37 @@ def chat_stream():
         for chunk in ask_qwen_stream(message_content, assistant_text):
             yield chunk
 
-    return Response(stream_with_context(generate()), mimetype='text/plain')
+    return Response(stream_with_context(generate()), mimetype='text/plain',
+                    headers={'X-Search-Scope': json.dumps(search_scope)})
 
 import sys
 
+def catalog_response(listing):
+    """A cached directory listing as JSON, or 304 when the browser's copy (If-None-Match) is current"""
+    _, body, etag = listing
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'  # Always revalidate, so new uploads show up
+    return resp.make_conditional(request)
+
 @app.route('/api/directory/clients')
 def get_clients():
-    base_path = r"c:\Users\chiky\irworkspace\ai_ir\faiss_index"
-    clients = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
-    return jsonify(clients)
+    return catalog_response(directory_catalog.clients())
 
 @app.route('/api/directory/categories')
 def get_categories():
     client = request.args.get('client')
-    base_path = fr"c:\Users\chiky\irworkspace\ai_ir\faiss_index\{client}"
-    categories = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
-    return jsonify(categories)
+    if not client:
+        return jsonify({"error": "Missing client"}), 400
+    return catalog_response(directory_catalog.categories(client))
 
 @app.route('/api/directory/years')
 def get_years():
     client = request.args.get('client')
     category = request.args.get('category')
-    base_path = fr"c:\Users\chiky\irworkspace\ai_ir\output_analysis\{client}\{category}"
-    
-    # Extract years from directory names or filenames
-    years = set()
-    for root, dirs, files in os.walk(base_path):
-        for name in files:
-            if name == 'pdf_analysis_summary.json':
-                # Extract year from path or filename
-                year_match = re.search(r'(\d{4})', root)
-                if year_match:
-                    years.add(year_match.group(1))
-    return jsonify(sorted(list(years), reverse=True))
+    if not client or not category:
+        return jsonify({"error": "Missing client or category"}), 400
+    return catalog_response(directory_catalog.years(client, category))
 
 from werkzeug.utils import secure_filename
 import shutil
@@ -431,8 +581,24 @@ def upload_pdf():
             yield f"ERROR:PDF processing error: {str(e)}\n"
             return
 
-        # Stage 3: Rebuilding index
+        # Stage 3: Swapping this report's pages into the yearly and combined indexes
         yield "STAGE:REBUILDING_INDEX\n"
+        try:
+            from update_faiss_index import upsert_report
+            updated = upsert_report(client, category, year, pdf_name, load_model())
+            directory_catalog.invalidate(client, category)
+            for index_path, page_index in updated.items():
+                remember_page_index(index_path, page_index)
+                yield f"INDEX:{index_path} now holds {page_index.ntotal} pages\n"
+            yield "STATUS:INDEX_REBUILT\n"
+            yield "COMPLETE:Upload and processing successful\n"
+            return
+        except RuntimeError as e:
+            yield f"INDEX:{str(e)}\n"  # Index without page IDs; rebuild the whole client/category once
+        except Exception as e:
+            yield f"ERROR:Index update error: {str(e)}\n"
+            return
+
         try:
             process = subprocess.Popen([
                 sys.executable,
@@ -448,6 +614,7 @@ def upload_pdf():
                 if output:
                     yield f"INDEX:{output.strip()}\n"
             
+            directory_catalog.invalidate(client, category)
             if process.returncode != 0:
                 yield "ERROR:Index rebuild failed\n"
                 return
@@ -460,6 +627,25 @@ def upload_pdf():
 
     return Response(stream_with_context(generate()), mimetype='text/plain')
 
+@app.route('/api/report', methods=['DELETE'])
+def delete_report():
+    """Withdraw one report from the yearly and combined indexes of its client/category"""
+    client = request.args.get('client')
+    category = request.args.get('category')
+    year = request.args.get('year')
+    report = request.args.get('report')
+    if not client or not category or not year or not report:
+        return jsonify({"error": "Missing client, category, year or report"}), 400
+    from update_faiss_index import remove_report
+    try:
+        updated = remove_report(client, category, year, report)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    directory_catalog.invalidate(client, category)
+    for index_path, page_index in updated.items():
+        remember_page_index(index_path, page_index)
+    return jsonify({"indexes": {path: page_index.ntotal for path, page_index in updated.items()}})
+
 if __name__ == '__main__':
     # Default values
     port = 5000
@@ -476,4 +662,4 @@ if __name__ == '__main__':
         except (IndexError, ValueError):
             print("Invalid port specified. Using default port 5000.")
 
-    app.run(port=port, debug=debug)
\ No newline at end of file
+    create_app().run(port=port, debug=debug)
\ No newline at end of file
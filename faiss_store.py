@@ -0,0 +1,482 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+import faiss
+from config import (FAISS_INDEX_TYPE, FAISS_PQ_M, FAISS_RERANK_FACTOR, HIERARCHY_SECTION_PAGES, HIERARCHY_REPORTS,
+                    HIERARCHY_SECTIONS)
+
+# Page indexes on disk, each file named after the version that wrote it:
+#   faiss_pages.<version>.index      IndexIDMap2 over the searchable index (raw float32, SQ8 or PQ codes)
+#   faiss_pages.<version>.meta.json  the indexed page records, each with its "id", in ID order
+#   faiss_pages.<version>.f16.npy    float16 copies of the vectors in ID order, only for compressed indexes
+#   faiss_pages.<version>.sections.npz  mean vectors of runs of HIERARCHY_SECTION_PAGES pages of each report
+#   faiss_pages.manifest.json        the published version and its files, replaced last
+# Readers follow the manifest, so they see a whole version or the previous one, never a mix.
+# Compressed codes are searched for FAISS_RERANK_FACTOR x k candidates, which are then re-ranked by
+# exact distance on the float16 vectors. The float16 file is memory-mapped, so only the rows of
+# candidates are read; the resident cost of an index is its codes.
+INDEX_TYPES = ("flat", "sq8", "pq")
+INDEX_FILE = "faiss_pages.index"
+META_SUFFIX = ".meta.json"
+VECTORS_SUFFIX = ".f16.npy"
+SECTIONS_SUFFIX = ".sections.npz"
+MANIFEST_SUFFIX = ".manifest.json"
+PQ_BITS = 8
+PQ_MIN_TRAIN = 4 * (1 << PQ_BITS)  # Below this, PQ codebooks are mostly noise and SQ8 is used instead
+
+# Page IDs are stable across rebuilds: | year (15 bits) | sha1(report) (32 bits) | page (16 bits) |
+# All pages of a report, and all reports of a year, form one contiguous ID range, so removing a
+# report is a single range delete. The top bit stays clear because FAISS uses -1 for "no result".
+ID_PAGE_BITS = 16
+ID_REPORT_BITS = 32
+
+def _year_number(year) -> int:
+    match = re.search(r"\d{4}", str(year or ""))
+    return int(match.group()) if match else 0
+
+def page_id(year, report: str, page: int) -> int:
+    page = int(page)
+    if not 0 <= page < 1 << ID_PAGE_BITS:
+        raise ValueError(f"Page number {page} does not fit in a page ID")
+    report_hash = int.from_bytes(hashlib.sha1(str(report).encode("utf-8")).digest()[:4], "big")
+    return (_year_number(year) << (ID_REPORT_BITS + ID_PAGE_BITS)) | (report_hash << ID_PAGE_BITS) | page
+
+def report_id_range(year, report: str):
+    """[low, high) of the page IDs of one report"""
+    low = page_id(year, report, 0)
+    return low, low + (1 << ID_PAGE_BITS)
+
+def year_id_range(year):
+    """[low, high) of the page IDs of every report of a year"""
+    low = _year_number(year) << (ID_REPORT_BITS + ID_PAGE_BITS)
+    return low, low + (1 << (ID_REPORT_BITS + ID_PAGE_BITS))
+
+def indexable_pages(pages: list) -> list:
+    """Pages worth a vector; builders and loaders both go through this so IDs never drift from records"""
+    return [page for page in pages if page.get("text", "").strip()]
+
+def meta_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + META_SUFFIX
+
+def vectors_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + VECTORS_SUFFIX
+
+def sections_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + SECTIONS_SUFFIX
+
+def manifest_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + MANIFEST_SUFFIX
+
+def _published_files(index_path: str):
+    """(version, {part: path}) of the last published PageIndex; version None for unversioned files"""
+    try:
+        with open(manifest_path(index_path), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None, {"index": index_path, "meta": meta_path(index_path), "vectors": vectors_path(index_path),
+                      "sections": sections_path(index_path)}
+    directory = os.path.dirname(index_path)
+    return manifest["version"], {part: os.path.join(directory, name) for part, name in manifest["files"].items()}
+
+def index_exists(index_path: str) -> bool:
+    return os.path.exists(manifest_path(index_path)) or os.path.exists(index_path)
+
+def index_version(index_path: str):
+    """Version of the published index at a path (changes with every save), or None if there is none"""
+    version, files = _published_files(index_path)
+    if version is not None:
+        return version
+    try:
+        return f"mtime-{os.stat(files['index']).st_mtime_ns}"
+    except OSError:
+        return None
+
+def _pq_subquantizers(dimension: int, pq_m: int) -> int:
+    """Largest sub-quantizer count <= pq_m that divides the dimension"""
+    return max(m for m in range(1, min(pq_m, dimension) + 1) if dimension % m == 0)
+
+def build_index(embeddings: np.ndarray, index_type: str = FAISS_INDEX_TYPE, pq_m: int = FAISS_PQ_M, add: bool = True):
+    """Train (if needed) an L2 index of the given type, filled with the embeddings unless add is False"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    count, dimension = embeddings.shape
+    if index_type == "pq" and count < PQ_MIN_TRAIN:
+        print(f"Only {count} vectors to train PQ codebooks (need {PQ_MIN_TRAIN}); using sq8 instead")
+        index_type = "sq8"
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    else:
+        index = faiss.IndexPQ(dimension, _pq_subquantizers(dimension, pq_m), PQ_BITS, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(embeddings)
+    if add:
+        index.add(embeddings)
+    return index
+
+def is_compressed(index) -> bool:
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return not isinstance(index, faiss.IndexFlat)
+
+def _write_atomic_index(index, index_path: str):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+def _write_vectors(vectors, index_path: str):
+    path = vectors_path(index_path)
+    if vectors is not None:
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, np.asarray(vectors, dtype=np.float16))
+        os.replace(tmp_path, path)
+    elif os.path.exists(path):
+        os.remove(path)  # Left over from a compressed build of the same index
+
+def write_index(index, embeddings: np.ndarray, index_path: str):
+    """Write a positional index, plus float16 vectors for re-ranking when its codes are lossy"""
+    _write_atomic_index(index, index_path)
+    _write_vectors(embeddings if is_compressed(index) else None, index_path)
+
+def _rerank(queries: np.ndarray, candidates: np.ndarray, k: int, vectors_of):
+    """Exact L2 top-k of each query's candidates; vectors_of maps candidate labels to float16 rows"""
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    labels = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        ids = ids[ids >= 0]
+        exact = ((vectors_of(ids).astype(np.float32) - query) ** 2).sum(axis=1)
+        order = np.argsort(exact, kind="stable")[:k]
+        distances[row, :len(order)] = exact[order]
+        labels[row, :len(order)] = ids[order]
+    return distances, labels
+
+class RerankedIndex:
+    """Compressed positional index whose candidates are re-ranked on float16 vectors.
+
+    Has the faiss search(queries, k) -> (distances, labels) signature, so callers don't change.
+    """
+
+    def __init__(self, index, vectors: np.ndarray, rerank_factor: int = FAISS_RERANK_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.rerank_factor = max(1, rerank_factor)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def search(self, queries: np.ndarray, k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        _, candidates = self.index.search(queries, k * self.rerank_factor)
+        return _rerank(queries, candidates, k, lambda ids: self.vectors[ids])
+
+def read_index(index_path: str, rerank_factor: int = FAISS_RERANK_FACTOR):
+    """Load a positional index for searching; compressed ones come back wrapped for float16 re-ranking"""
+    index = faiss.read_index(index_path)
+    path = vectors_path(index_path)
+    if not is_compressed(index) or rerank_factor <= 1 or not os.path.exists(path):
+        return index
+    return RerankedIndex(index, np.load(path, mmap_mode="r"), rerank_factor)
+
+def section_summaries(ids: np.ndarray, embeddings: np.ndarray, section_pages: int = HIERARCHY_SECTION_PAGES) -> dict:
+    """Mean vector of every run of section_pages pages of each report, sorted by the run's ID range.
+
+    A section's pages are the IDs in [low, high), so it never spans two reports. Report summaries
+    are the count-weighted means of their sections and are derived when searching.
+    """
+    order = np.argsort(ids)
+    ids = ids[order]
+    embeddings = np.asarray(embeddings, dtype=np.float32)[order]
+    report_low = ids & ~np.int64((1 << ID_PAGE_BITS) - 1)
+    low = report_low + ((ids - report_low) // section_pages) * section_pages
+    if not len(ids):
+        return {"low": low, "high": low, "means": embeddings, "counts": np.zeros(0, dtype=np.int64)}
+    starts = np.flatnonzero(np.r_[True, low[1:] != low[:-1]])
+    counts = np.diff(np.r_[starts, len(ids)])
+    means = np.add.reduceat(embeddings, starts, axis=0) / counts[:, None]
+    return {"low": low[starts], "high": low[starts] + section_pages, "means": means.astype(np.float32),
+            "counts": counts.astype(np.int64)}
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+class PageIndex:
+    """Page vectors, page records and float16 copies, all keyed by stable page IDs.
+
+    search() returns page IDs, which look up records in .pages. Reports can be upserted and
+    removed in place: the work is proportional to the report, not to the index.
+    search_hierarchical() narrows a query to its best reports and their best sections before
+    scoring any page, so its cost follows the relevant reports rather than the corpus.
+    """
+
+    def __init__(self, index, pages: dict, vectors: np.ndarray = None, sections: dict = None,
+                 rerank_factor: int = FAISS_RERANK_FACTOR):
+        self.index = index  # faiss.IndexIDMap2
+        self.pages = pages  # {page ID: page record}
+        self.compressed = is_compressed(index)
+        self.ids = np.array(sorted(pages), dtype=np.int64)  # Sorted page IDs
+        self.vectors = vectors  # float16 vectors row for row with self.ids; only for compressed indexes
+        self.sections = sections  # section_summaries() of every report, or None if never built
+        self._summaries = None
+        self._reports = None
+        self.rerank_factor = max(1, rerank_factor)
+        self.version = None  # Published version this was loaded from or last saved as
+        self.lock = threading.Lock()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @staticmethod
+    def _ids(pages: list) -> np.ndarray:
+        ids = np.array([page_id(page.get("year"), page.get("report", ""), page["page"]) for page in pages],
+                       dtype=np.int64)
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("Duplicate page IDs; every page needs a distinct (year, report, page)")
+        return ids
+
+    @classmethod
+    def build(cls, pages: list, embeddings: np.ndarray, index_type: str = FAISS_INDEX_TYPE,
+              pq_m: int = FAISS_PQ_M):
+        """Index pages that already carry "year" and "report"; embeddings are row-aligned with pages"""
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = cls._ids(pages)
+        index = faiss.IndexIDMap2(build_index(embeddings, index_type, pq_m, add=False))
+        index.add_with_ids(embeddings, ids)
+        page_index = cls(index, dict(zip(ids.tolist(), pages)), sections=section_summaries(ids, embeddings))
+        if page_index.compressed:
+            page_index.vectors = embeddings[np.argsort(ids)].astype(np.float16)
+        return page_index
+
+    @classmethod
+    def _load_files(cls, files: dict, rerank_factor: int):
+        if not os.path.exists(files["meta"]):
+            return None
+        index = faiss.read_index(files["index"])
+        if not isinstance(index, faiss.IndexIDMap2):
+            return None
+        with open(files["meta"], "r", encoding="utf-8") as f:
+            records = json.load(f)
+        pages = {record.pop("id"): record for record in records}
+        vectors = None
+        if is_compressed(index) and files.get("vectors") and os.path.exists(files["vectors"]):
+            vectors = np.load(files["vectors"], mmap_mode="r")
+        sections = None
+        if files.get("sections") and os.path.exists(files["sections"]):
+            with np.load(files["sections"]) as data:
+                sections = {name: data[name] for name in data.files}
+        return cls(index, pages, vectors, sections, rerank_factor)
+
+    @classmethod
+    def load(cls, index_path: str, rerank_factor: int = FAISS_RERANK_FACTOR):
+        """PageIndex saved by save(); None for indexes built before page IDs (rebuild those)"""
+        while True:
+            version, files = _published_files(index_path)
+            try:
+                page_index = cls._load_files(files, rerank_factor)
+            except (OSError, RuntimeError):
+                # A newer save may have published and cleaned up this version's files; follow it
+                if version is None or _published_files(index_path)[0] == version:
+                    raise
+                continue
+            if page_index is None and version is not None:
+                raise RuntimeError(f"{manifest_path(index_path)} names missing or invalid files")
+            if page_index is not None:
+                page_index.version = version
+            return page_index
+
+    def save(self, index_path: str):
+        """Write a new version of every file, then publish them together by replacing the manifest"""
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        base = os.path.splitext(index_path)[0]
+        with self.lock:
+            version = f"{time.time_ns():x}-{os.getpid()}"
+            files = {"index": f"{base}.{version}.index", "meta": f"{base}.{version}{META_SUFFIX}"}
+            faiss.write_index(self.index, files["index"])
+            records = [dict(self.pages[page_id], id=page_id) for page_id in self.ids.tolist()]
+            with open(files["meta"], "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            if self.compressed and self.vectors is not None:
+                files["vectors"] = f"{base}.{version}{VECTORS_SUFFIX}"
+                np.save(files["vectors"], np.asarray(self.vectors, dtype=np.float16))
+            if self.sections is not None:
+                files["sections"] = f"{base}.{version}{SECTIONS_SUFFIX}"
+                np.savez(files["sections"], **self.sections)
+            manifest = {"version": version, "files": {part: os.path.basename(path) for part, path in files.items()}}
+            tmp_path = f"{manifest_path(index_path)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, manifest_path(index_path))
+            self.version = version
+        _remove_unpublished(index_path, version)
+
+
+    def _vectors_of(self, ids: np.ndarray) -> np.ndarray:
+        if self.vectors is not None:
+            return self.vectors[np.searchsorted(self.ids, ids)].astype(np.float32)
+        return self.index.reconstruct_batch(ids)
+
+    def search(self, queries: np.ndarray, k: int):
+        """(distances, page IDs) of the k nearest pages of each query; missing results are -1"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        with self.lock:
+            if not self.compressed or self.vectors is None or self.rerank_factor == 1:
+                return self.index.search(queries, k)
+            _, candidates = self.index.search(queries, k * self.rerank_factor)
+            return _rerank(queries, candidates, k, self._vectors_of)
+
+    def search_ranges(self, queries: np.ndarray, k: int, ranges: list):
+        """search() over only the pages whose IDs fall in the given [low, high) ranges, by exact distance"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        with self.lock:
+            bounds = np.searchsorted(self.ids, np.array(ranges, dtype=np.int64).T)
+            ids = np.concatenate([self.ids[start:end] for start, end in bounds.T])
+            if not len(ids):
+                return distances, labels
+            vectors = self._vectors_of(ids)
+        for row, query in enumerate(queries):
+            exact = ((vectors - query) ** 2).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            distances[row, :len(order)] = exact[order]
+            labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+    def reports(self) -> list:
+        """Sorted (year, report) pairs of the indexed pages, cached until the next update"""
+        with self.lock:
+            if self._reports is None:
+                self._reports = sorted({(page.get("year"), page.get("report")) for page in self.pages.values()})
+            return self._reports
+
+    def _report_summaries(self):
+        """Unit section vectors, report keys and unit report vectors, cached until the next update"""
+        if self._summaries is None:
+            sections = self.sections
+            report_keys = sections["low"] >> ID_PAGE_BITS
+            starts = np.flatnonzero(np.r_[True, report_keys[1:] != report_keys[:-1]]) if len(report_keys) else report_keys
+            weighted = sections["means"] * sections["counts"][:, None]
+            report_vectors = np.add.reduceat(weighted, starts, axis=0) if len(starts) else weighted
+            self._summaries = (_unit(sections["means"]), report_keys[starts], _unit(report_vectors))
+        return self._summaries
+
+    def search_hierarchical(self, queries: np.ndarray, k: int, reports: int = HIERARCHY_REPORTS,
+                            sections: int = HIERARCHY_SECTIONS):
+        """search() narrowed report -> section -> page; falls back to search() without section summaries.
+
+        Each query scores every report summary, then the sections of its best reports, then only
+        the pages of its best sections (enough of them to fill k), by exact distance.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if self.sections is None or not len(self.sections["low"]):
+            return self.search(queries, k)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        labels = np.full((len(queries), k), -1, dtype=np.int64)
+        with self.lock:
+            section_vectors, report_keys, report_vectors = self._report_summaries()
+            low, high, counts = self.sections["low"], self.sections["high"], self.sections["counts"]
+            for row, query in enumerate(queries):
+                best_reports = report_keys[np.argsort(-(report_vectors @ query))[:reports]]
+                # Sections are sorted by ID, so each report's sections are one slice
+                bounds = np.searchsorted(low, np.stack([best_reports, best_reports + 1]) << ID_PAGE_BITS)
+                candidates = np.concatenate([np.arange(start, end) for start, end in bounds.T])
+                ranked = candidates[np.argsort(-(section_vectors[candidates] @ query))]
+                take = max(sections, int(np.searchsorted(np.cumsum(counts[ranked]), k)) + 1)
+                chosen = ranked[:take]
+                page_bounds = np.searchsorted(self.ids, np.stack([low[chosen], high[chosen]]))
+                ids = np.concatenate([self.ids[start:end] for start, end in page_bounds.T])
+                if not len(ids):
+                    continue
+                exact = ((self._vectors_of(ids) - query) ** 2).sum(axis=1)
+                order = np.argsort(exact, kind="stable")[:k]
+                distances[row, :len(order)] = exact[order]
+                labels[row, :len(order)] = ids[order]
+        return distances, labels
+
+    def _splice(self, low: int, high: int, ids: np.ndarray = None, vectors: np.ndarray = None,
+                sections: dict = None):
+        """Replace everything in the ID range [low, high) with the given sorted rows"""
+        start, end = np.searchsorted(self.ids, [low, high])
+        self._reports = None
+        new_ids = ids if ids is not None else self.ids[:0]
+        self.ids = np.concatenate([self.ids[:start], new_ids, self.ids[end:]])
+        if self.vectors is not None:
+            new_vectors = vectors if vectors is not None else self.vectors[:0]
+            self.vectors = np.concatenate([self.vectors[:start], new_vectors, self.vectors[end:]])
+        if self.sections is not None:
+            start, end = np.searchsorted(self.sections["low"], [low, high])
+            self.sections = {name: np.concatenate([values[:start], sections[name] if sections else values[:0],
+                                                   values[end:]])
+                             for name, values in self.sections.items()}
+            self._summaries = None
+
+    def _remove_range(self, low: int, high: int) -> int:
+        removed = self.index.remove_ids(faiss.IDSelectorRange(low, high))
+        start, end = np.searchsorted(self.ids, [low, high])
+        for page_id in self.ids[start:end].tolist():
+            self.pages.pop(page_id, None)
+        self._splice(low, high)
+        return int(removed)
+
+    def remove_report(self, year, report: str) -> int:
+        """Drop every page of a report; returns the number of vectors removed"""
+        with self.lock:
+            return self._remove_range(*report_id_range(year, report))
+
+    def upsert_report(self, year, report: str, pages: list, embeddings: np.ndarray) -> int:
+        """Replace all pages of a report with the given ones (row-aligned with embeddings)"""
+        for page in pages:
+            page["year"] = year
+            page["report"] = report
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        ids = self._ids(pages)
+        low, high = report_id_range(year, report)
+        with self.lock:
+            self._remove_range(low, high)
+            if not len(pages):
+                return 0
+            self.index.add_with_ids(embeddings, ids)
+            self.pages.update(zip(ids.tolist(), pages))
+            # The report's ID range is contiguous and now empty, so its rows go in as one block
+            order = np.argsort(ids)
+            vectors = embeddings[order].astype(np.float16) if self.vectors is not None else None
+            sections = section_summaries(ids, embeddings) if self.sections is not None else None
+            self._splice(low, high, ids[order], vectors, sections)
+            return len(pages)
+
+def _remove_unpublished(index_path: str, version: str):
+    """Delete unversioned files and versions older than the given one; files still open are left for next time"""
+    base = os.path.basename(os.path.splitext(index_path)[0])
+    versioned = re.compile(re.escape(base) + r"\.([0-9a-f]+)-\d+\.")
+    newest = int(version.split("-")[0], 16)
+    paths = [index_path, meta_path(index_path), vectors_path(index_path), sections_path(index_path)]
+    for name in os.listdir(os.path.dirname(index_path)):
+        match = versioned.match(name)
+        # Newer versions may belong to a save still in progress elsewhere
+        if match and int(match.group(1), 16) < newest:
+            paths.append(os.path.join(os.path.dirname(index_path), name))
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def index_memory_bytes(index) -> int:
+    """Resident size of an index: its serialized codes, plus the float16 vectors if they are in memory"""
+    if isinstance(index, (RerankedIndex, PageIndex)):
+        vectors = index.vectors
+        extra = 0 if vectors is None or isinstance(vectors, np.memmap) else vectors.nbytes
+        return index_memory_bytes(index.index) + extra
+    return int(faiss.serialize_index(index).nbytes)
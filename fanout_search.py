@@ -0,0 +1,71 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import FANOUT_WORKERS
+from hierarchical_search import search_pages
+
+# Multi-year questions search each year's index in parallel and merge the ranked lists, which makes
+# the combined index optional. FAISS releases the GIL while searching, so the threads overlap.
+FUSION_METHODS = ("rrf", "score")
+RRF_K = 60  # Reciprocal rank fusion constant; larger values flatten the rank weighting
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Created on first use, so gunicorn's preloading master never starts threads before forking
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, FANOUT_WORKERS), thread_name_prefix='fanout')
+        return _executor
+
+def _search_one(index, query_embeddings, k, id_ranges):
+    start = time.perf_counter()
+    distances, labels = search_pages(index, query_embeddings, k, id_ranges)
+    return distances[0], labels[0], (time.perf_counter() - start) * 1000
+
+def fuse(ranked: dict, k: int, method: str = "rrf") -> list:
+    """Merge {name: [(label, distance), ...]} ranked lists into the top k (name, label, score).
+
+    rrf scores an item by the sum of 1 / (RRF_K + rank) over the lists it appears in; "score"
+    turns each list's distances into similarities min-max scaled to [0, 1] and sums those.
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method {method!r}; expected one of {', '.join(FUSION_METHODS)}")
+    scores = {}
+    for name, items in ranked.items():
+        if not items:
+            continue
+        distances = np.array([distance for _, distance in items], dtype=np.float64)
+        span = distances.max() - distances.min()
+        for rank, (label, distance) in enumerate(items):
+            if method == "rrf":
+                score = 1.0 / (RRF_K + rank + 1)
+            else:
+                score = 1.0 - (distance - distances.min()) / span if span > 0 else 1.0
+            scores[(name, label)] = scores.get((name, label), 0.0) + score
+    merged = sorted(scores.items(), key=lambda item: -item[1])[:k]
+    return [(name, label, score) for (name, label), score in merged]
+
+def fan_out(indexes: dict, query_embeddings: np.ndarray, k: int, method: str = "rrf", id_ranges: dict = None):
+    """Search {name: index} concurrently for one query; returns ([(name, label, score)], {name: ms}).
+
+    id_ranges optionally maps names to page-ID ranges for search_pages. Labels are those of each
+    index (page IDs, or rows of positional indexes), so look them up in that index's pages.
+    """
+    id_ranges = id_ranges or {}
+    futures = {name: _get_executor().submit(_search_one, index, query_embeddings, k, id_ranges.get(name))
+               for name, index in indexes.items()}
+    ranked = {}
+    timings = {}
+    for name, future in futures.items():
+        try:
+            distances, labels, elapsed = future.result()
+        except Exception as e:
+            print(f"Search of index {name} failed: {str(e)}")
+            continue
+        ranked[name] = [(int(label), float(distance)) for label, distance in zip(labels, distances) if label >= 0]
+        timings[name] = round(elapsed, 3)
+    return fuse(ranked, k, method), timings
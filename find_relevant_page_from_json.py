@@ -1,15 +1,18 @@
 import json
-from sentence_transformers import SentenceTransformer, util
+import numpy as np
+from embedding_service import get_encoder
 
 def load_pdf_summary(json_path):
     with open(json_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 def find_most_relevant_page(pages, question):
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    page_embeddings = [model.encode(page["text"], convert_to_tensor=True) for page in pages]
-    question_embedding = model.encode(question, convert_to_tensor=True)
-    similarities = [util.pytorch_cos_sim(question_embedding, emb).item() for emb in page_embeddings]
+    model = get_encoder()
+    # One batched call for all pages instead of a forward pass per page
+    page_embeddings = model.encode([page["text"] for page in pages], convert_to_numpy=True)
+    question_embedding = model.encode([question], convert_to_numpy=True)[0]
+    norms = np.linalg.norm(page_embeddings, axis=1) * np.linalg.norm(question_embedding)
+    similarities = (page_embeddings @ question_embedding / np.maximum(norms, 1e-12)).tolist()
     best_idx = similarities.index(max(similarities))
     return pages[best_idx], similarities[best_idx]
 
@@ -0,0 +1,21 @@
+import gc
+
+# gunicorn -c gunicorn_chat_config.py 'faiss_chat_api:create_app(preload_model=True, warm_up=False)'
+bind = "0.0.0.0:5000"
+workers = 4
+timeout = 120
+graceful_timeout = 120
+keepalive = 5
+log_level = "info"
+
+# Load the embedding model once in the master; workers share its weights copy-on-write
+preload_app = True
+
+def when_ready(server):
+    # Keep GC passes in the workers from touching (and thereby copying) the preloaded objects
+    gc.freeze()
+
+def post_fork(server, worker):
+    # Threads don't survive fork, so each worker runs the rest of the warm-up itself; /ready reports it
+    import faiss_chat_api
+    faiss_chat_api.start_warmup()
@@ -0,0 +1,43 @@
+import re
+import numpy as np
+from config import HIERARCHICAL_SEARCH, HIERARCHY_MIN_PAGES
+
+# The fine end of report -> section -> page -> passage retrieval. Page indexes hold the coarse
+# levels (see PageIndex.search_hierarchical); passages are cut from the few pages a query ends up
+# with and embedded on the fly, so the index never stores more than one vector per page.
+PASSAGE_WORDS = 80
+PASSAGE_STRIDE = 60  # Overlapping windows, so a sentence on a boundary is whole in one of them
+
+def search_pages(index, query_embeddings: np.ndarray, k: int, id_ranges: list = None):
+    """Coarse-to-fine search on large page-ID indexes, flat search on everything else.
+
+    id_ranges (from query_router.id_ranges_for) limit a page-ID index to part of its pages.
+    """
+    if id_ranges and hasattr(index, "search_ranges"):
+        return index.search_ranges(query_embeddings, k, id_ranges)
+    if HIERARCHICAL_SEARCH and hasattr(index, "search_hierarchical") and index.ntotal >= HIERARCHY_MIN_PAGES:
+        return index.search_hierarchical(query_embeddings, k)
+    return index.search(query_embeddings, k)
+
+def split_passages(text: str, words: int = PASSAGE_WORDS, stride: int = PASSAGE_STRIDE) -> list:
+    tokens = re.split(r"\s+", text.strip())
+    if len(tokens) <= words:
+        return [" ".join(tokens)] if tokens != [""] else []
+    starts = list(range(0, len(tokens) - words, stride)) + [len(tokens) - words]
+    return [" ".join(tokens[start:start + words]) for start in starts]
+
+def best_passages(encoder, query_embedding: np.ndarray, pages: list) -> list:
+    """The passage of each page closest to the query; all passages are embedded in one call"""
+    passages = [split_passages(page.get("text", "")) for page in pages]
+    flat = [passage for page_passages in passages for passage in page_passages]
+    if not flat:
+        return ["" for _ in pages]
+    embeddings = np.asarray(encoder.encode(flat, convert_to_numpy=True), dtype=np.float32)
+    scores = embeddings @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    best = []
+    start = 0
+    for page_passages in passages:
+        end = start + len(page_passages)
+        best.append(page_passages[int(np.argmax(scores[start:end]))] if page_passages else "")
+        start = end
+    return best
@@ -0,0 +1,93 @@
+import os
+import argparse
+import numpy as np
+try:
+    import onnxruntime  # Optional CPU inference backend
+except ImportError:
+    onnxruntime = None
+from config import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR
+
+# all-MiniLM-L6-v2 as a dynamically int8-quantized ONNX graph. The sentence-transformers pipeline
+# (BERT encoder -> mean pooling -> L2 normalization) is reproduced here, so the vectors are
+# interchangeable with the torch model's and existing FAISS indexes keep working.
+HF_MODEL_ID = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+MAX_SEQ_LENGTH = 256  # Same truncation as the sentence-transformers config of the model
+
+def export_onnx_model(output_dir: str = EMBEDDING_ONNX_DIR, quantize: bool = True) -> str:
+    """Export the transformer to ONNX, quantize its weights to int8 and save the tokenizer next to it"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    model = AutoModel.from_pretrained(HF_MODEL_ID).eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in sample.keys()}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in sample.keys()), fp32_path,
+                          input_names=list(sample.keys()), output_names=["last_hidden_state"],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+    tokenizer.save_pretrained(output_dir)
+    print(f"Exported {HF_MODEL_ID} to {fp32_path}")
+    if not quantize:
+        return fp32_path
+    int8_path = os.path.join(output_dir, INT8_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Quantized weights to int8: {int8_path} "
+          f"({os.path.getsize(fp32_path) / 1e6:.1f} MB -> {os.path.getsize(int8_path) / 1e6:.1f} MB)")
+    return int8_path
+
+class OnnxEncoder:
+    """CPU encoder with the SentenceTransformer.encode signature, backed by ONNX Runtime"""
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, quantized: bool = True, threads: int = None):
+        if onnxruntime is None:
+            raise RuntimeError("EMBEDDING_BACKEND=onnx needs the onnxruntime package")
+        from transformers import AutoTokenizer
+
+        model_path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found; create it with 'python onnx_embedding.py --export'")
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        # Length-sorted batches pad less; results are put back in input order
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        embeddings = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_index = order[start:start + batch_size]
+            tokens = self.tokenizer([texts[i] for i in batch_index], padding=True, truncation=True,
+                                    max_length=MAX_SEQ_LENGTH, return_tensors="np")
+            feeds = {name: tokens[name].astype(np.int64) for name in tokens.keys() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            if embeddings.shape[1] == 0:
+                embeddings = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch_index] = pooled
+        return embeddings[0] if single else embeddings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the int8 ONNX version of the embedding model")
+    parser.add_argument("--export", action="store_true", help="Export and quantize the model")
+    parser.add_argument("--output-dir", default=EMBEDDING_ONNX_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="Only write the fp32 ONNX graph")
+    args = parser.parse_args()
+    if args.export:
+        export_onnx_model(args.output_dir, quantize=not args.no_quantize)
+    else:
+        parser.print_help()
@@ -1,5 +1,6 @@
 import os
 import math
+import numpy as np
 import fitz  # PyMuPDF
 from PIL import Image
 Image.MAX_IMAGE_PIXELS = None  # Remove decompression bomb protection
@@ -11,7 +12,103 @@ def clear_output_dir(output_dir):
             if os.path.isfile(file_path):
                 os.remove(file_path)
 
-def pdf_pages_to_two_column_image(pdf_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500):
+def pdf_pages_to_two_column_image_streaming(pdf_path, output_dir, quality=95, max_dim=65500, zoom=6.0,
+                                            columns=2, max_page_pixels=200000000, save_pages=False):
+    """Build the two-column mosaic one row of pages at a time.
+
+    The mosaic is assembled in a memory-mapped file on disk and encoded as a baseline JPEG, which
+    libjpeg writes scanline by scanline, so resident memory stays around one rendered page.
+    """
+    print(f"Starting streaming PDF processing: {pdf_path}")
+    os.makedirs(output_dir, exist_ok=True)
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    doc = fitz.open(pdf_path)
+    try:
+        if len(doc) == 0:
+            print(f"PDF has no pages: {pdf_path}")
+            return None
+
+        # Pass 1: measure every page at the requested zoom without rendering anything
+        page_zooms = []
+        for page in doc:
+            w, h = page.rect.width * zoom, page.rect.height * zoom
+            # Same per-page 200MP cap as the in-memory builder
+            limit = math.sqrt(max_page_pixels / (w * h)) if w * h > max_page_pixels else 1.0
+            page_zooms.append(zoom * limit)
+        rows = math.ceil(len(doc) / columns)
+
+        def layout(scale):
+            col_widths = [0] * columns
+            row_heights = [0] * rows
+            for i, page in enumerate(doc):
+                rect = (page.rect * fitz.Matrix(page_zooms[i] * scale, page_zooms[i] * scale)).irect
+                col_widths[i % columns] = max(col_widths[i % columns], rect.width)
+                row_heights[i // columns] = max(row_heights[i // columns], rect.height)
+            return col_widths, row_heights
+
+        # Pick the render scale up front so the finished mosaic already fits max_dim. Rendered sizes
+        # round up by less than a pixel per page, so one pixel per column and row is kept in reserve.
+        widths, heights = [0.0] * columns, [0.0] * rows
+        for i, page in enumerate(doc):
+            widths[i % columns] = max(widths[i % columns], page.rect.width * page_zooms[i])
+            heights[i // columns] = max(heights[i // columns], page.rect.height * page_zooms[i])
+        scale = min((max_dim - columns) / sum(widths), (max_dim - rows) / sum(heights), 1.0)
+        if scale < 1.0:
+            print(f"Rendering at scale {scale:.4f} so the mosaic fits within {max_dim} pixels")
+        col_widths, row_heights = layout(scale)
+        total_width, total_height = sum(col_widths), sum(row_heights)
+        print(f"Combined image dimensions will be: {total_width}x{total_height} pixels")
+
+        # Pass 2: render each row of pages at its final size into its strip of the on-disk canvas,
+        # then encode the JPEG from it. The canvas can be gigabytes, so it is removed however this ends.
+        canvas_path = os.path.join(output_dir, f"{pdf_name}_2col.rgbx.tmp")
+        combined_path = os.path.join(output_dir, f"{pdf_name}_2col.jpg")
+        canvas = strip = combined = None
+        try:
+            canvas = np.memmap(canvas_path, dtype=np.uint8, mode='w+', shape=(total_height, total_width, 4))
+            y_offset = 0
+            for row, row_height in enumerate(row_heights):
+                strip = canvas[y_offset:y_offset + row_height]
+                strip[:] = 255  # White background
+                x_offset = 0
+                for col in range(columns):
+                    idx = row * columns + col
+                    if idx >= len(doc):
+                        break
+                    page = doc.load_page(idx)
+                    page_zoom = page_zooms[idx] * scale
+                    pix = page.get_pixmap(matrix=fitz.Matrix(page_zoom, page_zoom), colorspace=fitz.csRGB, alpha=False)
+                    if save_pages:
+                        pix.save(os.path.join(output_dir, f"{pdf_name}_page_{idx + 1}.png"))
+                    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+                    strip[:pix.height, x_offset:x_offset + pix.width, :3] = \
+                        samples[:, :pix.width * 3].reshape(pix.height, pix.width, 3)
+                    print(f"Pasted page {idx + 1}/{len(doc)} at ({x_offset}, {y_offset})")
+                    del samples, pix  # Release the page before rendering the next one
+                    x_offset += col_widths[col]
+                canvas.flush()  # Written strips become clean file pages the OS can drop
+                y_offset += row_height
+
+            print(f"Saving combined image to: {combined_path}")
+            # Shares the mapped canvas rather than copying it. Progressive or optimized JPEGs would make
+            # libjpeg buffer the whole image, so this one is baseline.
+            combined = Image.frombuffer('RGBX', (total_width, total_height), canvas, 'raw', 'RGBX', 0, 1)
+            combined.save(combined_path, format='JPEG', quality=quality, subsampling=0)
+        finally:
+            canvas = strip = combined = None  # Unmap before deleting, which Windows requires
+            if os.path.exists(canvas_path):
+                os.remove(canvas_path)
+    finally:
+        doc.close()
+
+    print(f"Combined 2-column image saved: {combined_path}")
+    print(f"Final image size: {os.path.getsize(combined_path)/1024/1024:.2f} MB")
+    return combined_path
+
+def pdf_pages_to_two_column_image(pdf_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500, streaming=False):
+    if streaming:
+        return pdf_pages_to_two_column_image_streaming(pdf_path, output_dir, quality=quality, max_dim=max_dim,
+                                                       save_pages=True)
     print(f"Starting PDF processing: {pdf_path}")
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -132,11 +229,11 @@ if __name__ == "__main__":
     output_dir = r"c:\Users\chiky\irworkspace\ai_ir\pdf_images"
     clear_output_dir(output_dir)  # Clear the output directory before processing
     if os.path.isfile(input_path):
-        pdf_pages_to_two_column_image(input_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500)
+        pdf_pages_to_two_column_image(input_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500, streaming=True)
     elif os.path.isdir(input_path):
         for filename in os.listdir(input_path):
             if filename.lower().endswith('.pdf'):
                 pdf_path = os.path.join(input_path, filename)
-                pdf_pages_to_two_column_image(pdf_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500)
+                pdf_pages_to_two_column_image(pdf_path, output_dir, target_width=2400, output_format='JPEG', quality=95, max_dim=65500, streaming=True)
     else:
         print(f"Input path does not exist: {input_path}")
\ No newline at end of file
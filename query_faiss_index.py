@@ -1,7 +1,7 @@
 import json
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+from embedding_service import get_encoder
 import requests
 import base64
 import os
@@ -41,7 +41,7 @@ with open(r"c:\Users\chiky\irworkspace\ai_ir\output_analysis\pdf_analysis_summar
 texts = [page["text"] for page in pages]
 page_numbers = [page["page"] for page in pages]
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+model = get_encoder()  # Shared embedding server if running, else a local model
 
 last_question = None
 last_grouped_text = None
@@ -0,0 +1,173 @@
+import re
+from datetime import date
+
+# Finds the periods a question is about ("dividend per share in FY2023", "Q3 2022 revenue",
+# "last three years") so chat_stream can search the matching yearly index or page-ID ranges
+# instead of every year. Detected years are kept only if an index exists for them.
+QUARTER_WORDS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4}
+NUMBER_WORDS = {"two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+YEAR_SPAN = re.compile(r"\b((?:19|20)\d{2})\s*(?:-|–|/|to|through|until)\s*((?:19|20)?\d{2})\b", re.IGNORECASE)
+FISCAL_YEAR = re.compile(r"\b(?:FY|F\.Y\.?)\s*'?((?:19|20)?\d{2})(?:\s*(?:-|–|/)\s*((?:19|20)?\d{2}))?\b", re.IGNORECASE)
+YEAR = re.compile(r"\b((?:19|20)\d{2})\b")
+QUARTER = re.compile(r"\bQ([1-4])(?:\s*'(\d{2}))?\b|\b([1-4])Q(?:\s*'?(\d{2}))?\b", re.IGNORECASE)
+QUARTER_PHRASE = re.compile(r"\b(first|second|third|fourth|1st|2nd|3rd|4th)\s+quarter\b", re.IGNORECASE)
+LAST_YEARS = re.compile(r"\b(?:last|past|previous|recent)\s+(\d+|two|three|four|five|six|seven|eight|nine|ten)\s+"
+                        r"(?:financial\s+|fiscal\s+)?years\b", re.IGNORECASE)
+# "Latest" only scopes a question when it qualifies a period or report ("latest annual report"),
+# not in "the latest guidance on dividends"
+LATEST_YEAR = re.compile(r"\b(?:latest|most\s+recent|newest)\s+(?:(?:financial|fiscal|annual|quarterly)\s+)?"
+                         r"(?:year|report|quarter|results)s?\b", re.IGNORECASE)
+CURRENT_YEAR = re.compile(r"\b(?:this|current)\s+(?:financial\s+|fiscal\s+)?year\b", re.IGNORECASE)
+PREVIOUS_YEAR = re.compile(r"\b(?:last|previous|prior)\s+(?:financial\s+|fiscal\s+)?year\b", re.IGNORECASE)
+REPORT_QUARTER = re.compile(r"(?:^|[^a-z0-9])(?:q([1-4])(?!\d)|([1-4])q(?![a-z])|quarter[\s_-]*([1-4])(?!\d))",
+                            re.IGNORECASE)
+
+def _full_year(digits: str) -> int:
+    return int(digits) if len(digits) == 4 else 2000 + int(digits)
+
+def _span_years(first: str, second: str):
+    """Years of a span such as '2021-2023', '2023 to 2021' or '2023/24'; None if it isn't one.
+
+    A two-digit end only abbreviates a later year of the same century, so "2023 to 15 percent"
+    is not a span. Spans written newest first cover the same years as oldest first.
+    """
+    start = _full_year(first)
+    if len(second) == 2:
+        end = start // 100 * 100 + int(second)
+        if end <= start:
+            return None
+    else:
+        end = int(second)
+    low, high = min(start, end), max(start, end)
+    return range(low, high + 1) if high - low <= 30 else None
+
+def _year_number(name) -> int:
+    match = re.search(r"\d{4}", str(name))
+    return int(match.group()) if match else None
+
+def analyze_query(question: str, available_years=None, current_year: int = None) -> dict:
+    """Years, quarters and the phrases they came from.
+
+    available_years are the index folder names of the client/category. Returned years are the
+    matching folder names, newest first; without available_years they are four-digit strings.
+    "This year" and "last year" are relative to current_year (today's by default), or to the
+    newest indexed year when the indexes stop before last year.
+    """
+    years = set()
+    matches = []
+
+    def take_span(match):
+        span = _span_years(match.group(1), match.group(2))
+        if span is None:
+            return match.group(0)  # Not a span; its years are still found below
+        years.update(span)
+        matches.append(match.group(0))
+        return " "
+
+    def take_fiscal_year(match):
+        span = _span_years(match.group(1), match.group(2)) if match.group(2) else None
+        if span is None:
+            years.add(_full_year(match.group(1)))
+            end = match.end(1)  # Leave a trailing non-year ("FY2023 - 15 stores") in the text
+        else:
+            years.update(span)
+            end = match.end()
+        matches.append(match.string[match.start():end])
+        return " " + match.string[end:match.end()]
+
+    text = YEAR_SPAN.sub(take_span, question)
+    text = FISCAL_YEAR.sub(take_fiscal_year, text)
+
+    quarters = set()
+    for match in QUARTER.finditer(text):
+        quarters.add(int(match.group(1) or match.group(3)))
+        short_year = match.group(2) or match.group(4)
+        if short_year:
+            years.add(_full_year(short_year))
+        matches.append(match.group(0))
+    for match in QUARTER_PHRASE.finditer(text):
+        quarters.add(QUARTER_WORDS[match.group(1).lower()])
+        matches.append(match.group(0))
+
+    for match in YEAR.finditer(text):
+        years.add(int(match.group(1)))
+        matches.append(match.group(0))
+
+    by_number = {}
+    for name in available_years or []:
+        number = _year_number(name)
+        if number is not None:
+            by_number.setdefault(number, name)
+    newest = sorted(by_number, reverse=True)
+    if not years and newest:
+        this_year = current_year or date.today().year
+        if newest[0] < this_year - 1:
+            this_year = newest[0]  # Nothing indexed for last year yet; count from the newest reports
+        match = LAST_YEARS.search(question)
+        if match:
+            count = match.group(1).lower()
+            years.update(newest[:int(count) if count.isdigit() else NUMBER_WORDS[count]])
+            matches.append(match.group(0))
+        else:
+            for pattern, year in ((PREVIOUS_YEAR, this_year - 1), (CURRENT_YEAR, this_year), (LATEST_YEAR, newest[0])):
+                match = pattern.search(question)
+                if match:
+                    years.add(year)
+                    matches.append(match.group(0))
+                    break
+
+    if available_years is None:
+        routed = [str(year) for year in sorted(years, reverse=True)]
+    else:
+        routed = [by_number[year] for year in sorted(years, reverse=True) if year in by_number]
+    return {"years": routed, "quarters": sorted(quarters), "matches": matches}
+
+def report_quarter(report: str):
+    """Quarter number in a report name such as 'QR_Q3_2023' or '3Q2023', else None"""
+    match = REPORT_QUARTER.search(str(report or ""))
+    if not match:
+        return None
+    return int(match.group(1) or match.group(2) or match.group(3))
+
+def id_ranges_for(page_index, years: list, quarters: list):
+    """Page-ID ranges of a query's scope within a PageIndex, or None to search all of it.
+
+    Quarters narrow to the reports named after them, when there are any; several years narrow
+    to those years. A single year is normally routed to its own index and needs no ranges.
+    """
+    from faiss_store import report_id_range, year_id_range
+    if quarters:
+        ranges = [report_id_range(year, report) for year, report in page_index.reports()
+                  if (not years or year in years) and report_quarter(report) in quarters]
+        if ranges:
+            return ranges
+    if years:
+        return [year_id_range(year) for year in years]
+    return None
+
+if __name__ == "__main__":
+    # Self-check of the phrasings the router has to get right: python query_router.py
+    indexed = ["2020", "2021", "2022", "2023", "2024"]
+    cases = [
+        ("compare 2023 to 2022 revenue", ["2023", "2022"]),
+        ("How did revenue change from 2023 to 2021?", ["2023", "2022", "2021"]),
+        ("revenue growth 2021-2023", ["2023", "2022", "2021"]),
+        ("revenue in 2023 to 15 percent", ["2023"]),
+        ("FY2023/24 results", ["2024", "2023"]),
+        ("FY2023 - 15 new stores", ["2023"]),
+        ("dividend per share in FY22", ["2022"]),
+        ("Q3 2022 revenue", ["2022"]),
+        ("What was revenue last year?", ["2023"]),
+        ("latest dividend guidance", []),
+        ("Summarize the latest annual report", ["2024"]),
+        ("last three years of profit", ["2024", "2023", "2022"]),
+    ]
+    failed = 0
+    for question, expected in cases:
+        routed = analyze_query(question, indexed, current_year=2024)["years"]
+        if routed != expected:
+            failed += 1
+            print(f"FAIL {question!r}: expected {expected}, got {routed}")
+    print(f"{len(cases) - failed}/{len(cases)} router cases passed")
+    raise SystemExit(1 if failed else 0)
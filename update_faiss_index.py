@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+try:
+    import fcntl  # Unix file locking, shared by every worker and CLI run updating an index
+except ImportError:
+    fcntl = None
+from config import OUTPUT_ANALYSIS_DIR, FAISS_INDEX_DIR, FAISS_COMBINED_INDEX
+from faiss_store import PageIndex, INDEX_FILE, index_exists, indexable_pages, manifest_path
+
+# Add, replace or withdraw one report in the yearly and combined indexes of its client/category,
+# without re-embedding anything else. build_faiss_index.py remains the full rebuild.
+# Each index is changed under a lock, starting from its latest published version, so concurrent
+# updates from several workers all land; callers swap their cached copy only after the save.
+SUMMARY_JSON = "pdf_analysis_summary.json"
+
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+def summary_pages(summary_path: str, year, report: str) -> list:
+    """Indexable pages of one report's summary, tagged with the year and report of their page IDs"""
+    with open(summary_path, "r", encoding="utf-8") as f:
+        pages = indexable_pages(json.load(f))
+    for page in pages:
+        page["year"] = year
+        page["report"] = report
+    return pages
+
+def index_paths(client: str, category: str, year) -> list:
+    """The yearly and (if built) combined indexes a report of this year belongs to"""
+    base = os.path.join(FAISS_INDEX_DIR, client, category)
+    paths = [os.path.join(base, str(year), INDEX_FILE)]
+    combined = os.path.join(base, "combined", INDEX_FILE)
+    if FAISS_COMBINED_INDEX or index_exists(combined):
+        paths.append(combined)
+    return paths
+
+@contextmanager
+def index_lock(index_path: str):
+    """Serialize read-modify-save of one index across threads and, where possible, processes"""
+    with _path_locks_lock:
+        lock = _path_locks.setdefault(index_path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(f"{manifest_path(index_path)}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _load(index_path: str):
+    page_index = PageIndex.load(index_path)
+    if page_index is None and index_exists(index_path):
+        raise RuntimeError(f"{index_path} was built without page IDs; rebuild it with build_faiss_index.py")
+    return page_index
+
+def upsert_report(client: str, category: str, year, report: str, encoder=None) -> dict:
+    """Embed one report's pages and swap them into its indexes; returns {index path: saved PageIndex}"""
+    summary_path = os.path.join(OUTPUT_ANALYSIS_DIR, client, category, str(year), report, SUMMARY_JSON)
+    pages = summary_pages(summary_path, year, report)
+    if encoder is None:
+        from embedding_service import get_encoder
+        encoder = get_encoder()
+    embeddings = encoder.encode([page["text"] for page in pages], convert_to_numpy=True) if pages else None
+    updated = {}
+    for index_path in index_paths(client, category, year):
+        with index_lock(index_path):
+            page_index = _load(index_path)
+            start = time.perf_counter()
+            if page_index is None:
+                if not pages:
+                    continue
+                page_index = PageIndex.build([dict(page) for page in pages], embeddings)
+            else:
+                page_index.upsert_report(year, report, [dict(page) for page in pages], embeddings)
+            indexed = time.perf_counter()
+            page_index.save(index_path)
+        print(f"Upserted {len(pages)} pages of '{report}' into {index_path}: "
+              f"{(indexed - start) * 1000:.1f} ms index, {(time.perf_counter() - indexed) * 1000:.1f} ms save")
+        updated[index_path] = page_index
+    return updated
+
+def remove_report(client: str, category: str, year, report: str) -> dict:
+    """Withdraw one report from its indexes; returns {index path: saved PageIndex}"""
+    updated = {}
+    for index_path in index_paths(client, category, year):
+        with index_lock(index_path):
+            page_index = _load(index_path)
+            if page_index is None:
+                continue
+            start = time.perf_counter()
+            removed = page_index.remove_report(year, report)
+            indexed = time.perf_counter()
+            page_index.save(index_path)
+        print(f"Removed {removed} pages of '{report}' from {index_path}: "
+              f"{(indexed - start) * 1000:.1f} ms index, {(time.perf_counter() - indexed) * 1000:.1f} ms save")
+        updated[index_path] = page_index
+    return updated
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upsert or remove one report in its FAISS indexes")
+    parser.add_argument("action", choices=("upsert", "remove"))
+    parser.add_argument("client")
+    parser.add_argument("category")
+    parser.add_argument("year")
+    parser.add_argument("report", help="Report folder name under output_analysis/<client>/<category>/<year>/")
+    args = parser.parse_args()
+    try:
+        if args.action == "upsert":
+            upsert_report(args.client, args.category, args.year, args.report)
+        else:
+            remove_report(args.client, args.category, args.year, args.report)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)